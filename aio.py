@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+import sqlalchemy as sa
+from flask import has_request_context, request
+from sqlalchemy.engine import make_url
+from sqlalchemy.util import await_only
+
+from engine import engine_options
+
+# ----------------------------------------------------------------------------#
+# Async reads.
+# ----------------------------------------------------------------------------#
+
+# asgi.py runs the views of ASYNC_ENDPOINTS on the event loop, each in a
+# greenlet, and marks their environ with this key. Their queries go to an
+# async-driver twin of each bind, so every round trip to the database yields
+# the loop to other requests while the view code itself stays synchronous.
+ASYNC_ENVIRON_KEY = "fyyur.async"
+
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def serving_async():
+    """Whether the current request runs on the event loop"""
+
+    return has_request_context() and request.environ.get(ASYNC_ENVIRON_KEY, False)
+
+
+def sleep(seconds):
+    """time.sleep, yielding the event loop instead of blocking it in async requests"""
+
+    if serving_async():
+        await_only(asyncio.sleep(seconds))
+    else:
+        time.sleep(seconds)
+
+
+def async_bind(key):
+    """Bind key of the async twin of a bind (None being the default bind)"""
+
+    return "async" if key is None else f"{key}_async"
+
+
+def async_url(url):
+    url = make_url(url)
+    if url.get_dialect().is_async:
+        return url
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+
+def init_async_engines(app, db):
+    """Adds an async-driver twin of every bind to db.engines.
+
+    The default bind's twin connects to DATABASE_ASYNC_URL if set, else to
+    SQLALCHEMY_DATABASE_URI with the backend's async driver (asyncpg or
+    aiosqlite, which must be installed).
+    """
+
+    with app.app_context():
+        engines = db.engines
+        for key, engine in list(engines.items()):
+            url = async_url(engine.url)
+            if key is None and app.config["DATABASE_ASYNC_URL"]:
+                url = make_url(app.config["DATABASE_ASYNC_URL"])
+            engines[async_bind(key)] = sa.create_engine(
+                url, **engine_options(app.config, url, worker_class="async")
+            )
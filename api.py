@@ -0,0 +1,213 @@
+from datetime import datetime
+
+from flask import Blueprint, abort, current_app, jsonify, request
+
+from records import VENUE_FIELDS, ARTIST_FIELDS
+from metrics import query_budget
+from models import db, Venue, Artist, Show, split_genres
+from queries import filter_listing, encode_cursor, decode_cursor
+
+# ----------------------------------------------------------------------------#
+# JSON API.
+# ----------------------------------------------------------------------------#
+
+api = Blueprint("api", __name__, url_prefix="/api")
+
+# Selectable fields per resource, and the keyset each listing is ordered and
+# paged by (served by the (start_time, artist_id, venue_id), (name, id) and
+# (upcoming_shows_count, id) indexes)
+COUNTERS = ("upcoming_shows_count", "past_shows_count")
+VENUE_COLUMNS = {field: getattr(Venue, field) for field in VENUE_FIELDS + COUNTERS}
+ARTIST_COLUMNS = {field: getattr(Artist, field) for field in ARTIST_FIELDS + COUNTERS}
+SHOW_COLUMNS = {
+    "artist_id": Show.artist_id,
+    "venue_id": Show.venue_id,
+    "start_time": Show.start_time,
+    "artist_name": Artist.name.label("artist_name"),
+    "venue_name": Venue.name.label("venue_name"),
+}
+NAME_KEYSET = ("name", "id")
+POPULAR_KEYSET = ("upcoming_shows_count", "id")
+SHOW_KEYSET = ("start_time", "artist_id", "venue_id")
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def api_error(error):
+    return jsonify({"error": error.description}), error.code
+
+
+def to_json(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def row_json(row, fields):
+    """A selected row as JSON, with genres as a list like the detail endpoints"""
+
+    data = {field: to_json(row._mapping[field]) for field in fields}
+    if "genres" in data:
+        data["genres"] = split_genres(data["genres"])
+    return data
+
+
+def requested_fields(columns):
+    fields = request.args.get("fields")
+    if not fields:
+        return list(columns)
+
+    fields = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in columns]
+    if unknown:
+        abort(400, description=f"Unknown fields: {', '.join(unknown)}.")
+    return fields
+
+
+def date_arg(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        abort(400, description=f"Invalid {name} date: {value}.")
+
+
+def keyset_page(query, columns, keyset, descending=False):
+    """One page of query ordered by keyset, continuing after ?cursor=.
+
+    The page is fetched with a row-value comparison on the keyset instead of
+    an OFFSET, so every page costs the same however deep it is. descending
+    pages from the end of the keyset's index instead.
+    """
+
+    fields = requested_fields(columns)
+    page_size = max(
+        1,
+        min(
+            request.args.get("limit", current_app.config["API_PAGE_SIZE"], type=int),
+            current_app.config["API_MAX_PAGE_SIZE"],
+        ),
+    )
+    key_columns = [columns[key] for key in keyset]
+
+    selected = fields + [key for key in keyset if key not in fields]
+    query = query.with_only_columns(*[columns[key].label(key) for key in selected])
+
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            after = decode_cursor(cursor, key_columns)
+        except ValueError:
+            abort(400, description="Invalid cursor.")
+        if descending:
+            query = query.where(db.tuple_(*key_columns) < after)
+        else:
+            query = query.where(db.tuple_(*key_columns) > after)
+
+    order = key_columns
+    if descending:
+        order = [column.desc() for column in key_columns]
+    rows = db.session.execute(query.order_by(*order).limit(page_size + 1)).all()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor([rows[-1]._mapping[key] for key in keyset])
+
+    return jsonify(
+        {
+            "data": [row_json(row, fields) for row in rows],
+            "next_cursor": next_cursor,
+        }
+    )
+
+
+def filter_area(query, model):
+    """Applies ?city= (case-insensitive) and ?state= filters"""
+
+    return filter_listing(
+        query, model, city=request.args.get("city"), state=request.args.get("state")
+    )
+
+
+def filter_records(query, model):
+    """Applies ?city=, ?state=, ?genre= and ?upcoming=1 (has upcoming shows)"""
+
+    return filter_listing(
+        filter_area(query, model),
+        model,
+        genre=request.args.get("genre"),
+        upcoming=bool(request.args.get("upcoming")),
+    )
+
+
+def listing(query, columns):
+    """keyset_page by name, or by most upcoming shows with ?sort=popular"""
+
+    if request.args.get("sort") == "popular":
+        return keyset_page(query, columns, POPULAR_KEYSET, descending=True)
+    return keyset_page(query, columns, NAME_KEYSET)
+
+
+@api.route("/venues")
+@query_budget(1)
+def venues():
+    query = filter_records(db.select(Venue.id), Venue)
+    return listing(query, VENUE_COLUMNS)
+
+
+@api.route("/artists")
+@query_budget(1)
+def artists():
+    query = filter_records(db.select(Artist.id), Artist)
+    return listing(query, ARTIST_COLUMNS)
+
+
+@api.route("/shows")
+@query_budget(1)
+def shows():
+    """Shows filtered by ?venue_id=, ?artist_id=, venue ?city=/?state= and ?from=/?to="""
+
+    query = (
+        db.select(Show.start_time)
+        .join(Artist, Artist.id == Show.artist_id)
+        .join(Venue, Venue.id == Show.venue_id)
+    )
+    query = filter_area(query, Venue)
+
+    for key in ("venue_id", "artist_id"):
+        value = request.args.get(key, type=int)
+        if value is not None:
+            query = query.where(SHOW_COLUMNS[key] == value)
+
+    start, end = date_arg("from"), date_arg("to")
+    if start:
+        query = query.where(Show.start_time >= start)
+    if end:
+        query = query.where(Show.start_time < end)
+
+    return keyset_page(query, SHOW_COLUMNS, SHOW_KEYSET)
+
+
+def detail(record):
+    if record is None:
+        abort(404, description="Not found.")
+
+    data = record.__repr__()
+    for counter in COUNTERS:
+        data[counter] = getattr(record, counter)
+
+    fields = requested_fields(data)
+    return jsonify({field: to_json(data[field]) for field in fields})
+
+
+@api.route("/venues/<int:venue_id>")
+@query_budget(2)
+def venue(venue_id):
+    return detail(Venue.query.get(venue_id))
+
+
+@api.route("/artists/<int:artist_id>")
+@query_budget(2)
+def artist(artist_id):
+    return detail(Artist.query.get(artist_id))
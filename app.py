@@ -2,38 +2,183 @@
 # Imports
 # ----------------------------------------------------------------------------#
 
+import gc
+import os
 import sys
+import hashlib
+import json
 import logging
 from logging import FileHandler, Formatter
 from datetime import datetime
 
-import babel
-import dateutil.parser
 from flask import (
+    Blueprint,
     Flask,
     Response,
+    current_app,
     flash,
+    stream_template,
+    stream_with_context,
     redirect,
     render_template,
     request,
     url_for,
     jsonify,
     abort,
+    make_response,
+    session,
 )
-from flask_migrate import Migrate
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
-from flask_wtf import Form
-from forms import *
-from collections import defaultdict
+from sqlalchemy.exc import IntegrityError
+from werkzeug.http import is_resource_modified
+from functools import lru_cache, wraps
+from itertools import groupby
+from urllib.parse import urlencode
+
+from models import db, Venue, Artist, Show
+from queries import (
+    venue_areas,
+    venue_shows,
+    artist_shows,
+    all_shows,
+    filter_listing,
+    past_shows,
+    upcoming_shows,
+    encode_cursor,
+    decode_cursor,
+    latest_change,
+    row_count,
+    show_versions,
+)
+from records import normalize_venue, normalize_artist, VENUE_UNIQUE, ARTIST_UNIQUE
+from search import search_names
+from suggest import suggestions
+from export import EXPORT_FORMATS, EXPORT_KINDS
+from api import api
+from assets import assets
+from cache import cache
+from fragments import fragments
+from images import images, thumbnails
+from engine import engine_options, pool_stats
+from replicas import replicas, reads_from_replica
+from metrics import metrics, query_budget, internal
+from commands import fyyur_cli
+import counters  # keeps the Show counters in step with ORM show writes
+
+# Forms (WTForms), Babel's date formatting and dateutil are imported on first
+# use, and Flask-Migrate (which loads Alembic) only under the flask command,
+# for `flask db`, so that a worker boots on just the modules serving requests.
+# warm() imports the rest up front, e.g. before a preforking server forks.
 
 # ----------------------------------------------------------------------------#
 # App Config.
 # ----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object("config")
+pages = Blueprint("pages", __name__)
+moment = Moment()
+
+
+def create_app(config=None):
+    """Builds the app from config.py, overridden by the config mapping.
+
+    With PRELOAD set, the app is warmed before it is returned.
+    """
+
+    app = Flask(__name__)
+    app.config.from_object("config")
+    app.config.from_mapping(config or {})
+    if not app.config["SECRET_KEY"]:
+        if app.config["PRODUCTION"]:
+            raise RuntimeError(
+                "SECRET_KEY must be set in production, the same in every worker"
+            )
+        app.config["SECRET_KEY"] = os.urandom(32)
+
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+        app.config, app.config["SQLALCHEMY_DATABASE_URI"]
+    )
+    moment.init_app(app)
+    replicas.init_app(app)
+    db.init_app(app)
+    suggestions.init_app(app)
+    cache.init_app(app)
+    fragments.init_app(app)
+    metrics.init_app(app, db)
+    assets.init_app(app)
+    thumbnails.init_app(app)
+    if not app.config["BUILD_VERSION"]:
+        app.config["BUILD_VERSION"] = release_version(app)
+
+    app.jinja_env.filters["datetime"] = format_datetime
+    app.register_blueprint(pages)
+    app.register_blueprint(api)
+    app.register_blueprint(images)
+
+    app.cli.add_command(fyyur_cli)
+    if running_from_cli():
+        from flask_migrate import Migrate
+
+        Migrate(app, db)
+
+    if not app.debug:
+        file_handler = FileHandler("error.log")
+        file_handler.setFormatter(
+            Formatter(
+                "%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]"
+            )
+        )
+        app.logger.setLevel(logging.INFO)
+        file_handler.setLevel(logging.INFO)
+        app.logger.addHandler(file_handler)
+        app.logger.info("errors")
+
+    if app.config["PRELOAD"]:
+        warm(app)
+    return app
+
+
+def running_from_cli():
+    # Set by the flask command before it loads the app
+    return os.environ.get("FLASK_RUN_FROM_CLI") == "true"
+
+
+def release_version(app):
+    """A hash of what a deploy changes in rendered pages: the templates, and the
+    built asset names they link"""
+
+    digest = hashlib.sha1(
+        json.dumps([assets.files, assets.bundles], sort_keys=True).encode()
+    )
+    for name in sorted(app.jinja_env.list_templates()):
+        source, _, _ = app.jinja_env.loader.get_source(app.jinja_env, name)
+        digest.update(f"{name}\0{source}\0".encode())
+    return digest.hexdigest()[:16]
+
+
+def warm(app):
+    """Loads what every worker would otherwise load on its first requests.
+
+    The lazily imported modules, Babel's locale data, the compiled templates
+    and the suggestion index, which a server preloading the app (gunicorn
+    --preload) then shares with its forked workers. The database connections
+    opened meanwhile are closed, as a forked worker must not reuse them, and
+    gc.freeze() keeps the collector from touching (and so copying) the
+    shared objects.
+    """
+
+    import forms  # noqa: F401
+    import dateutil.parser  # noqa: F401
+
+    for format in DATETIME_FORMATS:
+        datetime_pattern(format)
+    for name in app.jinja_env.list_templates(extensions=["html"]):
+        app.jinja_env.get_template(name)
+
+    with app.app_context():
+        suggestions.ensure_built()
+        for engine in db.engines.values():
+            engine.dispose()
+    gc.freeze()
 
 
 # ----------------------------------------------------------------------------#
@@ -41,30 +186,303 @@ app.config.from_object("config")
 # ----------------------------------------------------------------------------#
 
 
+DATETIME_FORMATS = {
+    "full": "EEEE MMMM, d, y 'at' h:mma",
+    "medium": "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=32)
+def datetime_pattern(format):
+    """Babel pattern for a named or literal format, compiled once"""
+    import babel.dates
+
+    return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format))
+
+
+@lru_cache(maxsize=None)
+def datetime_locale():
+    import babel
+
+    return babel.Locale.parse("en")
+
+
+@lru_cache(maxsize=4096)
 def format_datetime(value, format="medium"):
-    date = dateutil.parser.parse(value)
-    if format == "full":
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == "medium":
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale="en")
+    """Formats a datetime (or an ISO 8601 string) with a cached, compiled pattern"""
+    if isinstance(value, str):
+        import dateutil.parser
 
+        value = dateutil.parser.parse(value)
+    return datetime_pattern(format).apply(value, datetime_locale())
 
-app.jinja_env.filters["datetime"] = format_datetime
 
 # ----------------------------------------------------------------------------#
-# Models.
+# Helpers.
 # ----------------------------------------------------------------------------#
-from models import *
-db.init_app(app)
-migrate = Migrate(app, db)
+
+
+def show_pages():
+    """The ?past_page= and ?upcoming_page= of a venue or artist page.
+
+    A page number past SHOWS_MAX_PAGES is a 400, so a request can't ask for
+    an unbounded number of shows.
+    """
+
+    pages = {}
+    for key in ("past_page", "upcoming_page"):
+        page = request.args.get(key, 1, type=int)
+        if not 1 <= page <= current_app.config["SHOWS_MAX_PAGES"]:
+            abort(400)
+        pages[key] = page
+    return pages
+
+
+def split_shows(shows, record):
+    """Splits a venue's or artist's shows into past and upcoming in the database.
+
+    Both lists are paged with "show more" links (?past_page=, ?upcoming_page=),
+    each page adding PAST_SHOWS_LIMIT / UPCOMING_SHOWS_LIMIT more rows, up to
+    SHOWS_MAX_PAGES; a page past the end of its list is a 404. The totals are
+    the record's maintained show counters, moved on by the shows started
+    since the last sweep so they split at now like the lists.
+    """
+
+    now = datetime.utcnow()
+    started, unstarted = counters.unswept_shows(shows, now)
+    data = {
+        "past_shows_count": record.past_shows_count + started - unstarted,
+        "upcoming_shows_count": record.upcoming_shows_count - started + unstarted,
+        **show_pages(),
+    }
+
+    for kind, select in (("past", past_shows), ("upcoming", upcoming_shows)):
+        page, count = data[f"{kind}_page"], data[f"{kind}_shows_count"]
+        limit = current_app.config[f"{kind.upper()}_SHOWS_LIMIT"]
+        if page > 1 and (page - 1) * limit >= count:
+            abort(404)
+
+        data[f"{kind}_shows"] = select(shows, now).limit(limit * page).all()
+        data[f"{kind}_more"] = (
+            limit * page < count and page < current_app.config["SHOWS_MAX_PAGES"]
+        )
+    return data
+
+
+def keyset_window(query, key_columns, page_size):
+    """One page of query, after the ?after= or before the ?before= keyset cursor.
+
+    Returns (rows, previous page cursor, next page cursor); a cursor is None
+    when there is no page in that direction.
+    """
+
+    after = request.args.get("after")
+    before = request.args.get("before")
+    keyset = db.tuple_(*key_columns)
+
+    try:
+        if before:
+            query = query.filter(keyset < decode_cursor(before, key_columns))
+        elif after:
+            query = query.filter(keyset > decode_cursor(after, key_columns))
+    except ValueError:
+        abort(400)
+
+    if before:
+        order = [column.desc() for column in key_columns]
+    else:
+        order = key_columns
+    rows = query.order_by(None).order_by(*order).limit(page_size + 1).all()
+
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    if before:
+        rows.reverse()
+    if not rows:
+        return rows, None, None
+
+    keys = [column.key for column in key_columns]
+    first = encode_cursor([getattr(rows[0], key) for key in keys])
+    last = encode_cursor([getattr(rows[-1], key) for key in keys])
+
+    if before:
+        return rows, first if more else None, last
+    return rows, first if after else None, last if more else None
+
+
+def date_window():
+    """The ?from= / ?to= dates (YYYY-MM-DD) of a listing, either may be None"""
+
+    window = []
+    for key in ("from", "to"):
+        value = request.args.get(key)
+        try:
+            window.append(datetime.strptime(value, "%Y-%m-%d") if value else None)
+        except ValueError:
+            abort(400)
+    return window
+
+
+def listing_filters():
+    """The ?genre=, ?city=, ?state=, ?upcoming=1 and ?sort= options of a listing"""
+
+    filters = {}
+    for key in ("genre", "city", "state", "upcoming", "sort"):
+        if request.args.get(key):
+            filters[key] = request.args[key]
+    return filters
+
+
+def cache_key(**values):
+    """View cache key of a request: its path and the (normalised) arguments the
+    view reads, so query strings it ignores don't make entries of their own"""
+
+    return (
+        request.path
+        + "?"
+        + urlencode(sorted((name, value) for name, value in values.items() if value))
+    )
+
+
+def filter_by(query, model, filters):
+    return filter_listing(
+        query,
+        model,
+        genre=filters.get("genre"),
+        city=filters.get("city"),
+        state=filters.get("state"),
+        upcoming=bool(filters.get("upcoming")),
+    )
+
+
+def genre_choices():
+    from forms import VenueForm
+
+    return [name for name, _ in VenueForm.genres.kwargs["choices"]]
+
+
+def venue_tags(venue_id):
+    """Cache tags of every page showing a venue.
+
+    That is its own page, the listings, and the pages of artists playing there.
+    """
+
+    artist_ids = db.session.query(Show.artist_id).filter(Show.venue_id == venue_id)
+    return ["venues", "shows", f"venue:{venue_id}"] + [
+        f"artist:{id}" for id, in artist_ids.distinct()
+    ]
+
+
+def artist_tags(artist_id):
+    """Cache tags of every page showing an artist.
+
+    That is its own page, the listings, and the pages of venues hosting it.
+    """
+
+    venue_ids = db.session.query(Show.venue_id).filter(Show.artist_id == artist_id)
+    return ["artists", "shows", f"artist:{artist_id}"] + [
+        f"venue:{id}" for id, in venue_ids.distinct()
+    ]
+
+
+def conditional(versions):
+    """Answers conditional GETs of a page from cheap validator queries.
+
+    versions(**view_args) returns the page's (markers, others): the
+    updated_at markers it depends on, the newest of which is sent as
+    Last-Modified, and other values such as row counts; both make up the
+    ETag, with the BUILD_VERSION, so a deploy changing the templates or the
+    assets they link invalidates every copy. When the client's copy still
+    matches, 304 is sent without running the view's show queries or
+    rendering its template. versions() returns None for a missing record, and
+    pages with pending flash messages are always rendered.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            validators = versions(**kwargs)
+            if validators is None or "_flashes" in session:
+                return view(**kwargs)
+
+            build = current_app.config["BUILD_VERSION"]
+            if current_app.jinja_env.auto_reload:
+                # Templates edited in development change the page, not the data
+                build = release_version(current_app)
+            etag = hashlib.sha1(repr((build, validators)).encode()).hexdigest()
+            last_modified = max(
+                (marker for marker in validators[0] if marker is not None),
+                default=None,
+            )
+
+            if is_resource_modified(
+                request.environ, etag=etag, last_modified=last_modified
+            ):
+                response = make_response(view(**kwargs))
+            else:
+                response = Response(status=304)
+
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            # Caches may keep the page, but must revalidate it on every visit
+            response.cache_control.no_cache = True
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def venue_versions(venue_id):
+    updated_at = db.session.query(Venue.updated_at).filter_by(id=venue_id).scalar()
+    if updated_at is None:
+        return None
+
+    shows_updated_at, artists_updated_at, count, next_start = show_versions(
+        venue_shows(venue_id), Artist, datetime.utcnow()
+    ).one()
+    return (updated_at, shows_updated_at, artists_updated_at), (count, next_start)
+
+
+def artist_versions(artist_id):
+    updated_at = db.session.query(Artist.updated_at).filter_by(id=artist_id).scalar()
+    if updated_at is None:
+        return None
+
+    shows_updated_at, venues_updated_at, count, next_start = show_versions(
+        artist_shows(artist_id), Venue, datetime.utcnow()
+    ).one()
+    return (updated_at, shows_updated_at, venues_updated_at), (count, next_start)
+
+
+def venues_versions():
+    # Show changes reach /venues through the counters, which bump Venue.updated_at
+    row = db.session.query(latest_change(Venue), row_count(Venue)).one()
+    return row[:1], row[1:]
+
+
+def artists_versions():
+    row = db.session.query(latest_change(Artist), row_count(Artist)).one()
+    return row[:1], row[1:]
+
+
+def shows_versions():
+    # Shows are only ever deleted with their venue, which the venue count catches
+    row = db.session.query(
+        latest_change(Show),
+        latest_change(Venue),
+        latest_change(Artist),
+        row_count(Venue),
+    ).one()
+    return row[:3], row[3:]
+
 
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
 
 
-@app.route("/")
+@pages.route("/")
 def index():
     return render_template("pages/home.html")
 
@@ -73,150 +491,190 @@ def index():
 #  ----------------------------------------------------------------
 
 
-@app.route("/venues")
+@pages.route("/venues")
+@reads_from_replica
+@conditional(venues_versions)
+@query_budget(2)
 def venues():
-    group = defaultdict(list)
-    data = []
+    """Venues by area, filtered by ?genre=, ?state=, ?city= and ?upcoming=1.
+
+    ?sort=popular lists each area's venues by most upcoming shows.
+    """
+
+    filters = listing_filters()
+    data = cache.memoize(
+        cache_key(**filters), ["venues"], lambda: venue_areas_page(filters)
+    )
+    return render_template(
+        "pages/venues.html", areas=data, filters=filters, genres=genre_choices()
+    )
+
 
-    vens = Venue.query.order_by(Venue.state).all()
-    for venue in vens:
-        v = {
-            "id": venue.id,
-            "name": venue.name,
-            "num_upcoming_shows": Show.query.filter(
-                Show.venue_id == venue.id, Show.start_time > datetime.utcnow()
-            ).count(),
-            "genres": venue.genres,
-        }
+def venue_areas_page(filters):
+    """Venues grouped by area, with upcoming show counts from a single grouped query"""
 
-        group[f"{venue.city},{venue.state}"].append(v)
+    data = []
+
+    rows = filter_by(
+        venue_areas(popular=filters.get("sort") == "popular"), Venue, filters
+    )
 
-    for city_state in group.keys():
+    for (city, state), area_venues in groupby(rows, key=lambda v: (v.city, v.state)):
         data.append(
             {
-                "city": city_state.split(",")[0],
-                "state": city_state.split(",")[1],
-                "venues": group[city_state],
+                "city": city,
+                "state": state,
+                "venues": [
+                    {
+                        "id": venue.id,
+                        "name": venue.name,
+                        "num_upcoming_shows": venue.num_upcoming_shows,
+                    }
+                    for venue in area_venues
+                ],
             }
         )
 
-    return render_template("pages/venues.html", areas=data)
+    return data
 
 
-@app.route("/venues/search", methods=["POST"])
+@pages.route("/venues/search", methods=["POST"])
+@reads_from_replica
+@query_budget(1)
 def search_venues():
     """Source: https://knowledge.udacity.com/questions/479944"""
     # TODO: implement search on venues with partial string search. Ensure it is case-insensitive.
     # seach for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
 
-    response = {"count": 0}
-    query = request.form.get("search_term", "")
-    data = Venue.query.filter(Venue.name.ilike(f"%{query}%")).all()
-    venues = []
-
-    for venue in data:
-        venues.append(
-            {
-                "id": venue.id,
-                "name": venue.name,
-            }
-        )
-
-        response = {"count": len(data), "data": venues}
+    search_term = request.form.get("search_term", "")
+    data = [
+        {"id": venue.id, "name": venue.name}
+        for venue in search_names(Venue, search_term, request.form.get("genre"))
+    ]
 
     return render_template(
-        "pages/search_artists.html",
-        results=response,
-        search_term=request.form.get("search_term", ""),
+        "pages/search_venues.html",
+        results={"count": len(data), "data": data},
+        search_term=search_term,
     )
 
 
-@app.route("/venues/<int:venue_id>")
+@pages.route("/search/suggest")
+def search_suggest():
+    """Typeahead matches for venue and artist names from the in-memory index"""
+
+    search_term = request.args.get("q", "")
+    suggestions.ensure_built()
+
+    results = []
+    for kind, id, name in suggestions.query(
+        search_term, current_app.config["SUGGEST_RESULTS_LIMIT"]
+    ):
+        if kind == "venue":
+            url = url_for("pages.show_venue", venue_id=id)
+        else:
+            url = url_for("pages.show_artist", artist_id=id)
+        results.append({"type": kind, "id": id, "name": name, "url": url})
+
+    return jsonify({"query": search_term, "results": results})
+
+
+@pages.route("/search/suggest/stats")
+@internal
+def search_suggest_stats():
+    suggestions.ensure_built()
+    return jsonify(suggestions.stats())
+
+
+@pages.route("/metrics")
+@internal
+def prometheus_metrics():
+    return metrics.response()
+
+
+@pages.route("/db/pool/stats")
+@internal
+def db_pool_stats():
+    """This worker's database connection pool utilisation"""
+    return jsonify(pool_stats(db.engine))
+
+
+@pages.route("/venues/<int:venue_id>")
+@reads_from_replica
+@conditional(venue_versions)
+@query_budget(7)
 def show_venue(venue_id):
     """Shows the venue page with the given venue_id"""
 
+    data = cache.memoize(
+        cache_key(**show_pages()), [f"venue:{venue_id}"], lambda: venue_page(venue_id)
+    )
+    if data is None:
+        abort(404)
+
+    return render_template("pages/show_venue.html", venue=data)
+
+
+def venue_page(venue_id):
     venue = Venue.query.get(venue_id)
-    shows = db.session.query(
-        Show.start_time.label("start_time"),
-        Show.venue_id.label("venue_id"),
-        Artist.id.label("artist_id"),
-        Artist.name.label("artist_name"),
-        Artist.image_link.label("artist_image"),
-    ).join(Artist, Artist.id == Show.artist_id)
+    if venue is None:
+        return None
 
     data = venue.__repr__()
-    data["past_shows"] = []
-    data["upcoming_shows"] = []
+    data.update(split_shows(venue_shows(venue_id), venue))
 
-    for show in shows:
-        if show.venue_id == venue_id:
-            show_data = {
+    for key in ("past_shows", "upcoming_shows"):
+        data[key] = [
+            {
                 "artist_id": show.artist_id,
                 "artist_name": show.artist_name,
                 "artist_image_link": show.artist_image,
-                "start_time": datetime.strftime(
-                    show.start_time, "%Y-%m-%dT%H:%M:%S.%fZ"
-                ),
+                "artist_updated_at": show.artist_updated_at,
+                "start_time": show.start_time,
             }
+            for show in data[key]
+        ]
 
-            if show.start_time >= datetime.utcnow():
-                data["upcoming_shows"].append(show_data)
-            else:
-                data["past_shows"].append(show_data)
-
-    return render_template("pages/show_venue.html", venue=data)
+    return data
 
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
 
-@app.route("/venues/create", methods=["GET"])
+@pages.route("/venues/create", methods=["GET"])
 def create_venue_form():
+    from forms import VenueForm
+
     form = VenueForm()
     return render_template("forms/new_venue.html", form=form)
 
 
-@app.route("/venues/create", methods=["POST"])
+@pages.route("/venues/create", methods=["POST"])
 def create_venue_submission():
     """Venue data add with address data all standardized to be uppercase"""
+    from forms import VenueForm
 
     form = VenueForm(request.form)
     error = False
 
     if form.validate():
-        if (
-            Venue.query.filter(
-                Venue.name == form.name.data,
-                Venue.address == form.address.data.upper(),
-                Venue.city == form.city.data.upper(),
-                Venue.state == form.state.data,
-            ).count()
-            > 0
-        ):
+        values = normalize_venue(dict(form.data, website=form.website_link.data))
+
+        if Venue.query.filter_by(**{k: values[k] for k in VENUE_UNIQUE}).count() > 0:
             flash(
                 "Looks like this venue already exists. To edit venue information, see the venue's details page and click the 'edit' button"
             )
             return render_template("forms/new_venue.html", form=form)
 
         try:
-            venue = Venue(
-                name=form.name.data,
-                city=form.city.data.upper(),
-                state=form.state.data,
-                address=form.address.data.upper(),
-                phone=form.phone.data,
-                image_link=form.image_link.data,
-                genres=",".join(form.genres.data),
-                facebook_link=form.facebook_link.data,
-                website=form.website_link.data,
-                seeking_talent=form.seeking_talent.data,
-                seeking_description=form.seeking_description.data,
-            )
+            venue = Venue(**values)
 
             db.session.add(venue)
             db.session.commit()
+            suggestions.add("venue", venue.id, venue.name)
+            cache.invalidate("venues", f"venue:{venue.id}")
 
             flash(request.form["name"] + " was successfully listed!")
 
@@ -234,7 +692,7 @@ def create_venue_submission():
             if error:
                 return render_template("forms/new_venue.html", form=form)
             else:
-                return redirect(url_for("venues"))
+                return redirect(url_for("pages.venues"))
 
     else:
         for fieldName, errorMessages in form.errors.items():
@@ -249,7 +707,7 @@ def create_venue_submission():
     # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
 
 
-@app.route("/venues/<int:venue_id>", methods=["DELETE"])
+@pages.route("/venues/<int:venue_id>", methods=["DELETE"])
 def delete_venue(venue_id):
     # TODO: Complete this endpoint for taking a venue_id, and using
     # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
@@ -260,9 +718,13 @@ def delete_venue(venue_id):
     error = False
     try:
         venue = Venue.query.get(venue_id)
+        tags = venue_tags(venue_id)
 
         db.session.delete(venue)
         db.session.commit()
+        suggestions.remove("venue", venue_id)
+        # Its shows go with it, which can drop artists from ?upcoming=1
+        cache.invalidate("artists", *tags)
 
         flash(f"{venue.name} has been successfully removed.")
 
@@ -278,102 +740,142 @@ def delete_venue(venue_id):
         db.session.close()
 
         if error:
-            return redirect(url_for("show_venue", venue_id=venue_id))
+            return redirect(url_for("pages.show_venue", venue_id=venue_id))
         else:
-            return redirect(url_for("venues"))
+            return redirect(url_for("pages.venues"))
 
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route("/artists")
+@pages.route("/artists")
+@reads_from_replica
+@conditional(artists_versions)
+@query_budget(2)
 def artists():
-    data = []
+    """Artists by name, a keyset page at a time (or streamed, with ?all=1).
+
+    ?genre=, ?state=, ?city= and ?upcoming=1 filter the listing.
+    """
+
+    filters = listing_filters()
+    query = filter_by(db.session.query(Artist.id, Artist.name), Artist, filters)
+
+    if request.args.get("all"):
+        rows = query.order_by(Artist.name, Artist.id).yield_per(1000)
+        data = ({"id": artist.id, "name": artist.name} for artist in rows)
+        return stream_template(
+            "pages/artists.html",
+            artists=data,
+            pager=None,
+            filters=filters,
+            genres=genre_choices(),
+        )
 
-    artists = Artist.query.order_by(Artist.name).all()
-    for artist in artists:
-        data.append({"id": artist.id, "name": artist.name})
+    def page():
+        rows, previous, next = keyset_window(
+            query, [Artist.name, Artist.id], current_app.config["ARTISTS_PAGE_SIZE"]
+        )
+        data = [{"id": artist.id, "name": artist.name} for artist in rows]
+        return data, previous, next
 
-    return render_template("pages/artists.html", artists=data)
+    key = cache_key(
+        **filters, after=request.args.get("after"), before=request.args.get("before")
+    )
+    data, previous, next = cache.memoize(key, ["artists"], page)
+
+    pager = {
+        "previous": previous and url_for("pages.artists", before=previous, **filters),
+        "next": next and url_for("pages.artists", after=next, **filters),
+        "all": url_for("pages.artists", all=1, **filters),
+    }
+    return render_template(
+        "pages/artists.html",
+        artists=data,
+        pager=pager,
+        filters=filters,
+        genres=genre_choices(),
+    )
 
 
-@app.route("/artists/search", methods=["POST"])
+@pages.route("/artists/search", methods=["POST"])
+@reads_from_replica
+@query_budget(1)
 def search_artists():
     """Source: https://knowledge.udacity.com/questions/479944"""
     # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
     # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
 
-    response = {"count": 0}
-    query = request.form.get("search_term", "")
-    data = Artist.query.filter(Artist.name.ilike(f"%{query}%")).all()
-    artists = []
-
-    for artist in data:
-        artists.append(
-            {
-                "id": artist.id,
-                "name": artist.name,
-            }
-        )
-
-        response = {"count": len(data), "data": artists}
+    search_term = request.form.get("search_term", "")
+    data = [
+        {"id": artist.id, "name": artist.name}
+        for artist in search_names(Artist, search_term, request.form.get("genre"))
+    ]
 
     return render_template(
         "pages/search_artists.html",
-        results=response,
-        search_term=request.form.get("search_term", ""),
+        results={"count": len(data), "data": data},
+        search_term=search_term,
     )
 
 
-@app.route("/artists/<int:artist_id>")
+@pages.route("/artists/<int:artist_id>")
+@reads_from_replica
+@conditional(artist_versions)
+@query_budget(7)
 def show_artist(artist_id):
     """Shows the artist page with the given artist_id"""
 
+    data = cache.memoize(
+        cache_key(**show_pages()),
+        [f"artist:{artist_id}"],
+        lambda: artist_page(artist_id),
+    )
+    if data is None:
+        abort(404)
+
+    return render_template("pages/show_artist.html", artist=data)
+
+
+def artist_page(artist_id):
     artist = Artist.query.get(artist_id)
-    shows = db.session.query(
-        Show.start_time.label("start_time"),
-        Show.artist_id.label("artist_id"),
-        Venue.id.label("venue_id"),
-        Venue.name.label("venue_name"),
-        Venue.image_link.label("venue_image"),
-    ).join(Venue, Venue.id == Show.venue_id)
+    if artist is None:
+        return None
 
     data = artist.__repr__()
-    data["past_shows"] = []
-    data["upcoming_shows"] = []
+    data.update(split_shows(artist_shows(artist_id), artist))
 
-    for show in shows:
-        if show.artist_id == artist_id:
-            show_data = {
+    for key in ("past_shows", "upcoming_shows"):
+        data[key] = [
+            {
                 "venue_id": show.venue_id,
                 "venue_name": show.venue_name,
                 "venue_image_link": show.venue_image,
-                "start_time": datetime.strftime(
-                    show.start_time, "%Y-%m-%dT%H:%M:%S.%fZ"
-                ),
+                "venue_updated_at": show.venue_updated_at,
+                "start_time": show.start_time,
             }
+            for show in data[key]
+        ]
 
-            if show.start_time >= datetime.utcnow():
-                data["upcoming_shows"].append(show_data)
-            else:
-                data["past_shows"].append(show_data)
-
-    return render_template("pages/show_artist.html", artist=data)
+    return data
 
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
 
-@app.route("/artists/create", methods=["GET"])
+@pages.route("/artists/create", methods=["GET"])
 def create_artist_form():
+    from forms import ArtistForm
+
     form = ArtistForm()
     return render_template("forms/new_artist.html", form=form)
 
 
-@app.route("/artists/create", methods=["POST"])
+@pages.route("/artists/create", methods=["POST"])
 def create_artist_submission():
     """Artist data add with address data all standardized to be upper case"""
+    from forms import ArtistForm
 
     # called upon submitting the new artist listing form
     # TODO: insert form data as a new Artist record in the db, instead
@@ -383,36 +885,21 @@ def create_artist_submission():
     error = False
 
     if form.validate():
-        if (
-            Artist.query.filter(
-                Artist.name == form.name.data,
-                Artist.phone == form.phone.data,
-                Artist.city == form.city.data.upper(),
-                Artist.state == form.state.data,
-            ).count()
-            > 0
-        ):
+        values = normalize_artist(dict(form.data, website=form.website_link.data))
+
+        if Artist.query.filter_by(**{k: values[k] for k in ARTIST_UNIQUE}).count() > 0:
             flash(
                 "Looks like this artist already exists. To edit artist information, see the artist's details page and click the 'edit' button"
             )
             return render_template("forms/new_artist.html", form=form)
 
         try:
-            artist = Artist(
-                name=form.name.data,
-                city=form.city.data.upper(),
-                state=form.state.data,
-                phone=form.phone.data,
-                image_link=form.image_link.data,
-                genres=",".join(form.genres.data),
-                facebook_link=form.facebook_link.data,
-                website=form.website_link.data,
-                seeking_venue=form.seeking_venue.data,
-                seeking_description=form.seeking_description.data,
-            )
+            artist = Artist(**values)
 
             db.session.add(artist)
             db.session.commit()
+            suggestions.add("artist", artist.id, artist.name)
+            cache.invalidate("artists", f"artist:{artist.id}")
 
             flash("Artist " + request.form["name"] + " was successfully listed!")
 
@@ -430,7 +917,7 @@ def create_artist_submission():
             if error:
                 return render_template("forms/new_artist.html", form=form)
             else:
-                return redirect(url_for("artists"))
+                return redirect(url_for("pages.artists"))
 
     else:
         for fieldName, errorMessages in form.errors.items():
@@ -445,17 +932,21 @@ def create_artist_submission():
 
 #  Update
 #  ----------------------------------------------------------------
-@app.route("/artists/<int:artist_id>/edit", methods=["GET"])
+@pages.route("/artists/<int:artist_id>/edit", methods=["GET"])
+@query_budget(2)
 def edit_artist(artist_id):
+    from forms import ArtistForm
+
     artist = Artist.query.get(artist_id)
-    artist.genres = artist.__repr__()["genres"]
     form = ArtistForm(obj=artist)
 
     return render_template("forms/edit_artist.html", form=form, artist=artist)
 
 
-@app.route("/artists/<int:artist_id>/edit", methods=["POST"])
+@pages.route("/artists/<int:artist_id>/edit", methods=["POST"])
 def edit_artist_submission(artist_id):
+    from forms import ArtistForm
+
     # TODO: take values from the form submitted, and update existing
     # artist record with ID <artist_id> using the new attributes
 
@@ -466,8 +957,9 @@ def edit_artist_submission(artist_id):
         try:
             artist = Artist.query.get(artist_id)
             form.populate_obj(artist)
-            artist.genres = ",".join(form.genres.data)
             db.session.commit()
+            suggestions.add("artist", artist_id, form.name.data)
+            cache.invalidate(*artist_tags(artist_id))
 
             flash(request.form["name"] + " details successfully updated!")
 
@@ -484,29 +976,33 @@ def edit_artist_submission(artist_id):
         finally:
             db.session.close()
             if error:
-                return redirect(url_for("edit_artist", artist_id=artist_id))
+                return redirect(url_for("pages.edit_artist", artist_id=artist_id))
             else:
-                return redirect(url_for("show_artist", artist_id=artist_id))
+                return redirect(url_for("pages.show_artist", artist_id=artist_id))
 
     else:
         for fieldName, errorMessages in form.errors.items():
             for err in errorMessages:
                 flash("An error occurred. " + err)
 
-        return redirect(url_for("edit_artist", artist_id=artist_id))
+        return redirect(url_for("pages.edit_artist", artist_id=artist_id))
 
 
-@app.route("/venues/<int:venue_id>/edit", methods=["GET"])
+@pages.route("/venues/<int:venue_id>/edit", methods=["GET"])
+@query_budget(2)
 def edit_venue(venue_id):
+    from forms import VenueForm
+
     venue = Venue.query.get(venue_id)
-    venue.genres = venue.__repr__()["genres"]
     form = VenueForm(obj=venue)
 
     return render_template("forms/edit_venue.html", form=form, venue=venue)
 
 
-@app.route("/venues/<int:venue_id>/edit", methods=["POST"])
+@pages.route("/venues/<int:venue_id>/edit", methods=["POST"])
 def edit_venue_submission(venue_id):
+    from forms import VenueForm
+
     # TODO: take values from the form submitted, and update existing
     # venue record with ID <venue_id> using the new attributes
 
@@ -517,9 +1013,10 @@ def edit_venue_submission(venue_id):
         try:
             venue = Venue.query.get(venue_id)
             form.populate_obj(venue)
-            venue.genres = ",".join(form.genres.data)
 
             db.session.commit()
+            suggestions.add("venue", venue_id, form.name.data)
+            cache.invalidate(*venue_tags(venue_id))
             flash(request.form["name"] + "venue details were successfully updated!")
 
         except:
@@ -535,66 +1032,96 @@ def edit_venue_submission(venue_id):
         finally:
             db.session.close()
             if error:
-                return redirect(url_for("edit_venue", venue_id=venue_id))
+                return redirect(url_for("pages.edit_venue", venue_id=venue_id))
             else:
-                return redirect(url_for("show_venue", venue_id=venue_id))
+                return redirect(url_for("pages.show_venue", venue_id=venue_id))
 
     else:
         for fieldName, errorMessages in form.errors.items():
             for err in errorMessages:
                 flash("An error occurred. " + err)
 
-        return redirect(url_for("edit_venue", venue_id=venue_id))
+        return redirect(url_for("pages.edit_venue", venue_id=venue_id))
 
 
 #  Shows
 #  ----------------------------------------------------------------
 
 
-@app.route("/shows")
+@pages.route("/shows")
+@reads_from_replica
+@conditional(shows_versions)
+@query_budget(2)
 def shows():
-    data = []
-
-    shows = (
-        db.session.query(
-            Show.start_time,
-            Venue.id.label("venue_id"),
-            Venue.name.label("venue_name"),
-            Artist.id.label("artist_id"),
-            Artist.name.label("artist_name"),
-            Artist.image_link.label("artist_image"),
+    """Shows in date order, a keyset page at a time (or streamed, with ?all=1).
+
+    ?from= / ?to= restrict the listing to a date window.
+    """
+
+    start, end = date_window()
+    query = all_shows()
+    if start:
+        query = query.filter(Show.start_time >= start)
+    if end:
+        query = query.filter(Show.start_time < end)
+    window = {
+        "from": start and start.strftime("%Y-%m-%d"),
+        "to": end and end.strftime("%Y-%m-%d"),
+    }
+
+    if request.args.get("all"):
+        data = (show_tile(show) for show in query.yield_per(1000))
+        return stream_template(
+            "pages/shows.html", shows=data, pager=None, window=window
         )
-        .join(Venue, Venue.id == Show.venue_id)
-        .join(Artist, Artist.id == Show.artist_id)
-        .order_by(Show.start_time)
-    )
 
-    for show in shows:
-        data.append(
-            {
-                "venue_id": show.venue_id,
-                "venue_name": show.venue_name,
-                "artist_id": show.artist_id,
-                "artist_name": show.artist_name,
-                "artist_image_link": show.artist_image,
-                "start_time": datetime.strftime(
-                    show.start_time, "%Y-%m-%dT%H:%M:%S.%fZ"
-                ),
-            }
+    def page():
+        rows, previous, next = keyset_window(
+            query,
+            [Show.start_time, Show.artist_id, Show.venue_id],
+            current_app.config["SHOWS_PAGE_SIZE"],
         )
+        return [show_tile(show) for show in rows], previous, next
 
-    return render_template("pages/shows.html", shows=data)
-
-
-@app.route("/shows/create")
+    key = cache_key(
+        **window, after=request.args.get("after"), before=request.args.get("before")
+    )
+    data, previous, next = cache.memoize(key, ["shows"], page)
+
+    pager = {
+        "previous": previous and url_for("pages.shows", before=previous, **window),
+        "next": next and url_for("pages.shows", after=next, **window),
+        "all": url_for("pages.shows", all=1, **window),
+    }
+    return render_template("pages/shows.html", shows=data, pager=pager, window=window)
+
+
+def show_tile(show):
+    return {
+        "venue_id": show.venue_id,
+        "venue_name": show.venue_name,
+        "artist_id": show.artist_id,
+        "artist_name": show.artist_name,
+        "artist_image_link": show.artist_image,
+        "venue_updated_at": show.venue_updated_at,
+        "artist_updated_at": show.artist_updated_at,
+        "start_time": show.start_time,
+    }
+
+
+@pages.route("/shows/create")
 def create_shows():
+    from forms import ShowForm
+
     # renders form. do not touch.
     form = ShowForm()
     return render_template("forms/new_show.html", form=form)
 
 
-@app.route("/shows/create", methods=["POST"])
+@pages.route("/shows/create", methods=["POST"])
 def create_show_submission():
+    from forms import ShowForm
+
     # called to create new shows in the db, upon submitting new show listing form
     # TODO: insert form data as a new Show record in the db, instead
 
@@ -602,22 +1129,26 @@ def create_show_submission():
     error = False
 
     if form.validate():
-        if form.artist_id.data not in [i[0] for i in db.session.query(Artist.id).all()]:
+        # Primary key lookups in a single round trip, whatever the catalogue size
+        artist_exists, venue_exists, show_exists = db.session.query(
+            db.exists().where(Artist.id == form.artist_id.data),
+            db.exists().where(Venue.id == form.venue_id.data),
+            db.exists().where(
+                Show.artist_id == form.artist_id.data,
+                Show.venue_id == form.venue_id.data,
+                Show.start_time == form.start_time.data,
+            ),
+        ).one()
+
+        if not artist_exists:
             flash("The artist id entered is invalid. Please re-enter.")
             error = True
 
-        if form.venue_id.data not in [i[0] for i in db.session.query(Venue.id).all()]:
+        if not venue_exists:
             flash("The venue id entered is invalid. Please re-enter.")
             error = True
 
-        if (
-            Show.query.filter(
-                Show.artist_id == form.artist_id.data,
-                Show.venue_id == form.venue_id.data,
-                Show.start_time == form.start_time.data,
-            ).count()
-            > 0
-        ):
+        if show_exists:
             flash("Looks like this show's already in the books!")
             error = True
 
@@ -633,9 +1164,24 @@ def create_show_submission():
 
             db.session.add(show)
             db.session.commit()
+            cache.invalidate(
+                "shows",
+                "venues",
+                "artists",
+                f"venue:{form.venue_id.data}",
+                f"artist:{form.artist_id.data}",
+            )
 
             flash("Show was successfully listed!")
 
+        except IntegrityError:
+            # Same show booked concurrently, or artist/venue removed since the check
+            flash(
+                "This show could not be listed. It is already in the books, or its artist or venue no longer exists."
+            )
+            error = True
+            db.session.rollback()
+
         except:
             flash(
                 "An error occurred. Your show could not be listed at this time. Please try again."
@@ -648,7 +1194,7 @@ def create_show_submission():
             if error:
                 return render_template("forms/new_show.html", form=form)
             else:
-                return redirect(url_for("shows"))
+                return redirect(url_for("pages.shows"))
 
     else:
         for fieldName, errorMessages in form.errors.items():
@@ -661,37 +1207,46 @@ def create_show_submission():
     # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
 
 
-@app.errorhandler(404)
+#  Export
+#  ----------------------------------------------------------------
+
+
+@pages.route("/export/<kind>.<format>")
+def export_data(kind, format):
+    """Streams every venue, artist or show as NDJSON or CSV"""
+
+    if kind not in EXPORT_KINDS or format not in EXPORT_FORMATS:
+        abort(404)
+
+    lines, mimetype = EXPORT_FORMATS[format]
+    return Response(
+        stream_with_context(lines(kind)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={kind}.{format}"},
+    )
+
+
+@pages.app_errorhandler(404)
 def not_found_error(error):
     return render_template("errors/404.html"), 404
 
 
-@app.errorhandler(500)
+@pages.app_errorhandler(500)
 def server_error(error):
     return render_template("errors/500.html"), 500
 
 
-if not app.debug:
-    file_handler = FileHandler("error.log")
-    file_handler.setFormatter(
-        Formatter("%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]")
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info("errors")
-
 # ----------------------------------------------------------------------------#
 # Launch.
 # ----------------------------------------------------------------------------#
 
 # Default port:
 if __name__ == "__main__":
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 """
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 """
@@ -0,0 +1,149 @@
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.util import await_only, greenlet_spawn
+from werkzeug.exceptions import HTTPException
+
+from aio import ASYNC_ENVIRON_KEY, init_async_engines
+from app import create_app, db
+
+# ----------------------------------------------------------------------------#
+# ASGI server.
+# ----------------------------------------------------------------------------#
+
+# Serve with e.g. `uvicorn asgi:app`. GET/HEAD requests for ASYNC_ENDPOINTS
+# (the venue, artist and show pages) run on the event loop, their queries
+# through the async twin engines; form posts and every other route run on
+# a thread pool as under a WSGI server.
+
+flask_app = create_app()
+init_async_engines(flask_app, db)
+threads = ThreadPoolExecutor(flask_app.config["ASYNC_SYNC_THREADS"])
+
+
+def wsgi_environ(scope, body):
+    root_path = scope.get("root_path", "")
+    path = scope["path"]
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path) :]
+    server = scope.get("server") or ("localhost", 80)
+
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": root_path.encode().decode("latin1"),
+        "PATH_INFO": path.encode().decode("latin1"),
+        "QUERY_STRING": scope["query_string"].decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+
+    for name, value in scope["headers"]:
+        name, value = name.decode("latin1"), value.decode("latin1")
+        if name == "content-type":
+            key = "CONTENT_TYPE"
+        elif name == "content-length":
+            key = "CONTENT_LENGTH"
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def runs_async(environ):
+    if environ["REQUEST_METHOD"] not in ("GET", "HEAD"):
+        return False
+    try:
+        endpoint, _ = flask_app.url_map.bind_to_environ(environ).match()
+    except HTTPException:
+        return False
+    return endpoint in flask_app.config["ASYNC_ENDPOINTS"]
+
+
+def respond(environ, send):
+    """Runs the Flask app on environ, passing each ASGI message to send()"""
+
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = [
+            (name.lower().encode("latin1"), value.encode("latin1"))
+            for name, value in headers
+        ]
+
+    def start():
+        if "sent" not in started:
+            send(
+                {
+                    "type": "http.response.start",
+                    "status": started["status"],
+                    "headers": started["headers"],
+                }
+            )
+            started["sent"] = True
+
+    body = flask_app.wsgi_app(environ, start_response)
+    try:
+        for chunk in body:
+            if chunk:
+                start()
+                send({"type": "http.response.body", "body": chunk, "more_body": True})
+    finally:
+        if hasattr(body, "close"):
+            body.close()
+
+    start()
+    send({"type": "http.response.body", "body": b""})
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        raise ValueError(f"Unsupported ASGI scope: {scope['type']}")
+
+    environ = wsgi_environ(scope, await read_body(receive))
+    loop = asyncio.get_running_loop()
+
+    if runs_async(environ):
+        # The view runs in a greenlet; each query awaits on the loop
+        environ[ASYNC_ENVIRON_KEY] = True
+        await greenlet_spawn(respond, environ, lambda m: await_only(send(m)))
+    else:
+        await loop.run_in_executor(
+            threads,
+            respond,
+            environ,
+            lambda m: asyncio.run_coroutine_threadsafe(send(m), loop).result(),
+        )
@@ -0,0 +1,297 @@
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import posixpath
+import re
+
+from flask import current_app, request, send_from_directory, url_for
+
+# ----------------------------------------------------------------------------#
+# Static assets.
+# ----------------------------------------------------------------------------#
+
+# `flask fyyur assets` builds static/ into static/dist/: every file under a
+# content-hashed name ("css/main.css" -> "dist/css/main.<hash>.css"), CSS
+# minified with its url()s pointing at the hashed fonts and images, each of
+# ASSET_BUNDLES concatenated into one file, and gzip and brotli variants next
+# to whatever compresses. dist/manifest.json maps the source names to the
+# built ones. Older builds are left in place for pages still referencing them.
+
+DIST = "dist"
+MANIFEST = "manifest.json"
+COMPRESSIBLE = (".css", ".js", ".map", ".svg", ".ttf", ".otf", ".eot", ".json")
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+
+# A hashed name never changes content, so browsers may keep it for a year
+# without revalidating
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+SOURCE_MAP_URL = re.compile(r"(//[#@] sourceMappingURL=)(\S+)")
+# Comments, except /*! licence headers */
+CSS_COMMENT = re.compile(r"/\*(?!!).*?\*/", re.S)
+
+
+def fingerprint(path, data):
+    """path with a hash of data before its extension"""
+
+    root, ext = posixpath.splitext(path)
+    return f"{root}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def minify_css(text):
+    """Drops comments and the whitespace around blocks, declarations and lists"""
+
+    text = CSS_COMMENT.sub("", text)
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s*([{};,])\s*", r"\1", text)
+    return text.replace(";}", "}").strip()
+
+
+def minify_js(text):
+    try:
+        import rjsmin
+    except ImportError:
+        return text
+    return rjsmin.jsmin(text, keep_bang_comments=True)
+
+
+def relative_url(url, source, target, built):
+    """A url relative to static path source, made relative to target instead.
+
+    It points at the built copy of what it references, if there is one.
+    """
+
+    if re.match(r"^([a-z]+:|/|#)", url):
+        return url
+    path, suffix = re.match(r"^([^?#]*)(.*)$", url).groups()
+    path = posixpath.normpath(posixpath.join(posixpath.dirname(source), path))
+    path = built.get(path, path)
+    return posixpath.relpath(path, posixpath.dirname(target)) + suffix
+
+
+def rewrite_css(text, source, target, built):
+    def replace(match):
+        quote, url = match.groups()
+        return f"url({quote}{relative_url(url, source, target, built)}{quote})"
+
+    return minify_css(CSS_URL.sub(replace, text))
+
+
+def rewrite_js(text, source, target, built):
+    text = SOURCE_MAP_URL.sub(
+        lambda match: match[1] + relative_url(match[2], source, target, built), text
+    )
+    if not source.endswith(".min.js"):
+        text = minify_js(text)
+    return text
+
+
+def optimise_image(data, path, max_width, jpeg_quality):
+    """data scaled down to max_width and recompressed, if Pillow is installed"""
+
+    try:
+        from PIL import Image
+    except ImportError:
+        return data
+
+    image = Image.open(io.BytesIO(data))
+    if image.width > max_width:
+        height = round(image.height * max_width / image.width)
+        image = image.resize((max_width, height), Image.LANCZOS)
+
+    output = io.BytesIO()
+    if path.endswith(".png"):
+        image.save(output, "PNG", optimize=True)
+    else:
+        image.save(
+            output,
+            "JPEG",
+            quality=jpeg_quality,
+            optimize=True,
+            progressive=True,
+            icc_profile=image.info.get("icc_profile"),
+        )
+    return output.getvalue() if output.tell() < len(data) else data
+
+
+def compress(data):
+    """{encoding: bytes} of the variants worth serving"""
+
+    variants = {"gzip": gzip.compress(data, 9, mtime=0)}
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        variants["br"] = brotli.compress(data, quality=11)
+    return {
+        encoding: variant
+        for encoding, variant in variants.items()
+        if len(variant) < len(data) * 0.9
+    }
+
+
+def build_assets(static_folder, bundles, image_max_width, jpeg_quality):
+    """Builds static_folder into its dist/ folder and writes the manifest.
+
+    Returns the manifest and a (name, source bytes, built bytes, {encoding:
+    bytes}) row per file.
+    """
+
+    def read(path):
+        with open(os.path.join(static_folder, path), "rb") as f:
+            return f.read()
+
+    def size(path):
+        return os.path.getsize(os.path.join(static_folder, path))
+
+    def write(path, data):
+        full_path = os.path.join(static_folder, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "wb") as f:
+            f.write(data)
+
+    def transform(source, target):
+        data = read(source)
+        if source.endswith(".css"):
+            return rewrite_css(data.decode(), source, target, built).encode()
+        if source.endswith(".js"):
+            return rewrite_js(data.decode(), source, target, built).encode()
+        if source.endswith((".jpg", ".jpeg", ".png")):
+            return optimise_image(data, source, image_max_width, jpeg_quality)
+        return data
+
+    def emit(name, path, source_size, data):
+        built_path = posixpath.join(DIST, fingerprint(path, data))
+        write(built_path, data)
+        variants = compress(data) if path.endswith(COMPRESSIBLE) else {}
+        for encoding, variant in variants.items():
+            write(built_path + ENCODINGS[encoding], variant)
+        encodings[built_path] = sorted(variants)
+        rows.append(
+            (name, source_size, len(data), {e: len(v) for e, v in variants.items()})
+        )
+        return built_path
+
+    sources = []
+    for root, dirs, files in os.walk(static_folder):
+        path = os.path.relpath(root, static_folder).replace(os.sep, "/")
+        if path == DIST:
+            dirs[:] = []
+            continue
+        sources += [
+            posixpath.normpath(posixpath.join(path, name))
+            for name in files
+            if not name.startswith(".")
+        ]
+
+    # What CSS and JS reference is built first, so they can point at it
+    order = {".js": 1, ".css": 2}
+    sources.sort(key=lambda path: (order.get(posixpath.splitext(path)[1], 0), path))
+
+    built, bundled, encodings, rows = {}, {}, {}, []
+    for path in sources:
+        target = posixpath.join(DIST, path)
+        data = transform(path, target)
+        built[path] = emit(path, path, size(path), data)
+
+    for name, paths in bundles.items():
+        target = posixpath.join(DIST, "bundles", name)
+        separator = b"\n" if name.endswith(".css") else b"\n;\n"
+        data = separator.join(transform(path, target) for path in paths)
+        bundled[name] = emit(
+            f"bundle {name}", f"bundles/{name}", sum(map(size, paths)), data
+        )
+
+    manifest = {"files": built, "bundles": bundled, "encodings": encodings}
+    # Replaced in one step, so a worker starting meanwhile reads a whole one
+    write(posixpath.join(DIST, MANIFEST + ".tmp"), json.dumps(manifest).encode())
+    os.replace(
+        os.path.join(static_folder, DIST, MANIFEST + ".tmp"),
+        os.path.join(static_folder, DIST, MANIFEST),
+    )
+    return manifest, rows
+
+
+class Assets:
+    """Points static URLs at the built assets and serves them.
+
+    With BUILT_ASSETS, url_for("static", filename=...) gives the hashed name
+    of a built file, bundle_urls(name) in templates gives the URL of a built
+    bundle, and those are sent with immutable caching, as brotli or gzip when
+    the client accepts it. Without BUILT_ASSETS, or before the first build,
+    the sources are linked and served as they are.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.bundles = {}
+        self.encodings = {}
+
+    def init_app(self, app):
+        self.sources = app.config["ASSET_BUNDLES"]
+        self.files, self.bundles, self.encodings = {}, {}, {}
+        if app.config["BUILT_ASSETS"]:
+            self.load(app)
+
+        app.url_defaults(self.hashed_url)
+        app.jinja_env.globals["bundle_urls"] = self.bundle_urls
+        app.view_functions["static"] = self.send_static_file
+
+    def load(self, app):
+        path = os.path.join(app.static_folder, DIST, MANIFEST)
+        try:
+            with open(path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            app.logger.warning(
+                "%s is missing; run `flask fyyur assets` to build the assets", path
+            )
+            return
+        self.files = manifest["files"]
+        self.bundles = manifest["bundles"]
+        self.encodings = manifest["encodings"]
+
+    def hashed_url(self, endpoint, values):
+        if endpoint == "static" and values.get("filename") in self.files:
+            values["filename"] = self.files[values["filename"]]
+
+    def bundle_urls(self, name):
+        """URLs of a bundle: the built file, else each of its sources"""
+
+        if name in self.bundles:
+            return [url_for("static", filename=self.bundles[name])]
+        return [url_for("static", filename=path) for path in self.sources[name]]
+
+    def send_static_file(self, filename):
+        if filename not in self.encodings:
+            return current_app.send_static_file(filename)
+
+        name, content_encoding = filename, None
+        for encoding in ("br", "gzip"):
+            if (
+                encoding in self.encodings[filename]
+                and request.accept_encodings[encoding]
+            ):
+                name, content_encoding = filename + ENCODINGS[encoding], encoding
+                break
+
+        response = send_from_directory(
+            current_app.static_folder,
+            name,
+            mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+            max_age=IMMUTABLE_MAX_AGE,
+        )
+        response.content_encoding = content_encoding
+        if self.encodings[filename]:
+            response.vary.add("Accept-Encoding")
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+assets = Assets()
@@ -0,0 +1,634 @@
+import contextlib
+import io
+import json
+import random
+import re
+import statistics
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, time as clock, timedelta
+from http.cookiejar import CookieJar
+
+import click
+
+# ----------------------------------------------------------------------------#
+# Requests.
+# ----------------------------------------------------------------------------#
+
+SEARCH_TERMS = ["a", "the", "jazz", "hall", "band", "new", "ro", "ve"]
+# Common to rare terms in generated artist names, and one matching none
+ARTIST_TERMS = ["a", "the", "ro", "sax", "neon", "kim", "velvet", "wolves", "zzz"]
+GENRES = ["Jazz", "Rock n Roll", "Blues", "Classical", "Folk", "Pop"]
+
+
+def venue_form(rng, name):
+    return {
+        "name": name,
+        "city": "Austin",
+        "state": "TX",
+        "address": f"{rng.randint(1, 9999)} Bench St",
+        "phone": f"512-555-{rng.randint(0, 9999):04d}",
+        "genres": rng.sample(GENRES, 2),
+        "website_link": "https://bench.example.com",
+        "seeking_talent": "y",
+        "seeking_description": "Benchmark venue",
+    }
+
+
+def artist_form(rng, name):
+    return {
+        "name": name,
+        "city": "Austin",
+        "state": "TX",
+        "phone": f"512-555-{rng.randint(0, 9999):04d}",
+        "genres": rng.sample(GENRES, 2),
+        "website_link": "https://bench.example.com",
+        "seeking_venue": "y",
+        "seeking_description": "Benchmark artist",
+    }
+
+
+def show_form(rng, ids):
+    day = rng.randint(30, 3650)
+    start = time.strftime("%Y-%m-%d", time.gmtime(time.time() + day * 86400))
+    return {
+        "artist_id": rng.choice(ids["artists"]),
+        "venue_id": rng.choice(ids["venues"]),
+        "start_time": f"{start} {rng.randint(18, 23)}:{rng.choice(('00', '30'))}:00",
+    }
+
+
+# Route name, weight in the mix, and a function of (rng, known ids, unique
+# name) returning (method, path, form data). Reads dominate, roughly as on the
+# live site; each form POST writes to the database under test.
+ROUTES = [
+    ("home", 2, lambda rng, ids, name: ("GET", "/", None)),
+    ("venues", 5, lambda rng, ids, name: ("GET", "/venues", None)),
+    (
+        "venues filtered",
+        2,
+        lambda rng, ids, name: (
+            "GET",
+            f"/venues?genre={urllib.parse.quote(rng.choice(GENRES))}"
+            "&upcoming=1&sort=popular",
+            None,
+        ),
+    ),
+    (
+        "venue",
+        15,
+        lambda rng, ids, name: ("GET", f"/venues/{rng.choice(ids['venues'])}", None),
+    ),
+    ("artists", 5, lambda rng, ids, name: ("GET", "/artists", None)),
+    (
+        "artist",
+        15,
+        lambda rng, ids, name: ("GET", f"/artists/{rng.choice(ids['artists'])}", None),
+    ),
+    ("shows", 8, lambda rng, ids, name: ("GET", "/shows", None)),
+    (
+        "search venues",
+        5,
+        lambda rng, ids, name: (
+            "POST",
+            "/venues/search",
+            {"search_term": rng.choice(SEARCH_TERMS)},
+        ),
+    ),
+    (
+        "search artists",
+        5,
+        lambda rng, ids, name: (
+            "POST",
+            "/artists/search",
+            {"search_term": rng.choice(SEARCH_TERMS)},
+        ),
+    ),
+    (
+        "suggest",
+        5,
+        lambda rng, ids, name: (
+            "GET",
+            f"/search/suggest?q={rng.choice(SEARCH_TERMS)}",
+            None,
+        ),
+    ),
+    ("api venues", 3, lambda rng, ids, name: ("GET", "/api/venues?limit=50", None)),
+    ("api shows", 3, lambda rng, ids, name: ("GET", "/api/shows?limit=50", None)),
+    ("new venue form", 1, lambda rng, ids, name: ("GET", "/venues/create", None)),
+    (
+        "create venue",
+        1,
+        lambda rng, ids, name: ("POST", "/venues/create", venue_form(rng, name)),
+    ),
+    (
+        "create artist",
+        1,
+        lambda rng, ids, name: ("POST", "/artists/create", artist_form(rng, name)),
+    ),
+    (
+        "create show",
+        1,
+        lambda rng, ids, name: ("POST", "/shows/create", show_form(rng, ids)),
+    ),
+    (
+        "edit venue",
+        1,
+        lambda rng, ids, name: (
+            "POST",
+            f"/venues/{rng.choice(ids['venues'])}/edit",
+            venue_form(rng, name),
+        ),
+    ),
+    (
+        "edit artist",
+        1,
+        lambda rng, ids, name: (
+            "POST",
+            f"/artists/{rng.choice(ids['artists'])}/edit",
+            artist_form(rng, name),
+        ),
+    ),
+]
+
+
+WRITE_ROUTES = ("create ", "edit ")
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Times a form POST's own response, not the page it redirects to"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def client():
+    """An opener with its own cookie jar, like one browser"""
+
+    return urllib.request.build_opener(
+        urllib.request.HTTPCookieProcessor(CookieJar()), NoRedirect()
+    )
+
+
+def send(opener, base, method, path, data):
+    """Sends one request; returns its status, after reading the whole body"""
+
+    body = None
+    if data is not None:
+        body = urllib.parse.urlencode(data, doseq=True).encode()
+    request = urllib.request.Request(base + path, data=body, method=method)
+
+    try:
+        with opener.open(request, timeout=60) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code
+    except (urllib.error.URLError, OSError):
+        return 0
+
+
+def known_ids(base, sample):
+    """Venue and artist ids to request, from the JSON API"""
+
+    opener = client()
+    ids = {}
+    for kind in ("venues", "artists"):
+        url = f"{base}/api/{kind}?fields=id&limit={sample}&sort=popular"
+        with opener.open(url, timeout=60) as response:
+            ids[kind] = [row["id"] for row in json.load(response)["data"]]
+        if not ids[kind]:
+            raise click.ClickException(
+                f"No {kind} to request; run `flask fyyur generate`."
+            )
+    return ids
+
+
+def server_memory(base, token=None):
+    """Peak RSS of the worker answering /metrics, in bytes, if it reports one"""
+
+    request = urllib.request.Request(f"{base}/metrics")
+    if token:
+        request.add_header("Authorization", f"Bearer {token}")
+    try:
+        with client().open(request, timeout=10) as response:
+            for line in response.read().decode().splitlines():
+                if line.startswith("fyyur_process_max_rss_bytes"):
+                    return int(float(line.rsplit(" ", 1)[1]))
+    except (urllib.error.URLError, OSError, ValueError):
+        pass
+    return None
+
+
+# ----------------------------------------------------------------------------#
+# Statistics.
+# ----------------------------------------------------------------------------#
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarise(latencies, errors, elapsed):
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / elapsed, 1),
+        **{
+            name: round(percentile(ordered, fraction) * 1000, 2) if ordered else None
+            for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+        },
+    }
+
+
+def report(results, previous=None):
+    previous = previous or {}
+    header = f"{'route':<18}{'reqs':>8}{'errs':>6}{'req/s':>9}"
+    header += f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    if previous:
+        header += f"{'Δp50':>8}{'Δp95':>8}{'Δreq/s':>9}"
+    click.echo(header)
+
+    for name, stats in results.items():
+        line = f"{name:<18}{stats['requests']:>8}{stats['errors']:>6}{stats['rps']:>9}"
+        for key in ("p50", "p95", "p99"):
+            line += f"{stats[key] if stats[key] is not None else '-':>9}"
+
+        before = previous.get(name)
+        if before:
+            for key, width in (("p50", 8), ("p95", 8), ("rps", 9)):
+                if stats[key] and before[key]:
+                    line += f"{(stats[key] / before[key] - 1) * 100:>+{width - 1}.0f}%"
+                else:
+                    line += f"{'-':>{width}}"
+        click.echo(line)
+
+
+# ----------------------------------------------------------------------------#
+# Benchmarks.
+# ----------------------------------------------------------------------------#
+
+
+@click.group()
+def cli():
+    """Fyyur benchmarks.
+
+    load drives a running server over HTTP. The other scenarios build their
+    own catalogue and time the app in-process, so they need the app's
+    requirements but no server.
+    """
+
+
+@cli.command("load")
+@click.argument("base_url")
+@click.option("-c", "--concurrency", default=8, show_default=True)
+@click.option("-d", "--duration", default=30.0, show_default=True, help="Seconds.")
+@click.option("--warmup", default=5.0, show_default=True, help="Unrecorded seconds.")
+@click.option("--seed", default=1, show_default=True)
+@click.option("--sample", default=500, show_default=True, help="Ids to request.")
+@click.option("--reads-only", is_flag=True, help="Leave out the form POSTs.")
+@click.option("--json", "output", type=click.Path(), help="Save the results.")
+@click.option("--compare", type=click.Path(exists=True), help="Earlier results.")
+@click.option(
+    "--metrics-token", envvar="FYYUR_METRICS_TOKEN", help="For the server's /metrics."
+)
+def bench(
+    base_url,
+    concurrency,
+    duration,
+    warmup,
+    seed,
+    sample,
+    reads_only,
+    output,
+    compare,
+    metrics_token,
+):
+    """Drive every page, search and form of the server at BASE_URL.
+
+    Each of --concurrency clients (threads with their own cookies) sends a
+    weighted mix of requests for --duration seconds after a --warmup, and
+    throughput and p50/p95/p99 latency are reported per route. The form POSTs
+    create and edit records, so point it at a database loaded for the
+    purpose (`flask fyyur generate`). Save a run with --json and compare a
+    later commit to it with --compare.
+
+    The server's peak RSS, read from /metrics (with --metrics-token, or
+    FYYUR_METRICS_TOKEN, when it sets one), gives req/s per GiB: e.g. to
+    compare sync and async serving per worker, run `uvicorn asgi:app` once
+    with FYYUR_ASYNC_ENDPOINTS= (every view on threads) and once without.
+    """
+
+    base = base_url.rstrip("/")
+    ids = known_ids(base, sample)
+    routes = [
+        route
+        for route in ROUTES
+        if not (reads_only and route[0].startswith(WRITE_ROUTES))
+    ]
+    weights = [weight for _, weight, _ in routes]
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    run = f"{int(time.time())}"
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    def worker(n):
+        rng = random.Random(seed * 1000 + n)
+        opener = client()
+        count = 0
+
+        while (now := time.perf_counter()) < stop_at:
+            name, _, make = rng.choices(routes, weights=weights)[0]
+            count += 1
+            method, path, data = make(rng, ids, f"Bench {run}-{n}-{count}")
+
+            status = send(opener, base, method, path, data)
+            latency = time.perf_counter() - now
+            if now < measure_from:
+                continue
+
+            with lock:
+                if 200 <= status < 400:
+                    latencies[name].append(latency)
+                else:
+                    errors[name] += 1
+
+    threads = [
+        threading.Thread(target=worker, args=(n,), daemon=True)
+        for n in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.perf_counter() - measure_from
+    results = {
+        name: summarise(latencies[name], errors[name], elapsed) for name, _, _ in routes
+    }
+    results["total"] = summarise(
+        [latency for values in latencies.values() for latency in values],
+        sum(errors.values()),
+        elapsed,
+    )
+
+    memory = server_memory(base, metrics_token)
+
+    previous = None
+    if compare:
+        with open(compare, encoding="utf-8") as f:
+            previous = json.load(f)["results"]
+    report(results, previous)
+    if memory:
+        mib = memory / 2**20
+        per_gib = results["total"]["rps"] / (memory / 2**30)
+        click.echo(f"server peak RSS {mib:.0f} MiB, {per_gib:.0f} req/s per GiB")
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "base_url": base,
+                    "concurrency": concurrency,
+                    "duration": duration,
+                    "seed": seed,
+                    "reads_only": reads_only,
+                    "server_rss_bytes": memory,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+
+# ----------------------------------------------------------------------------#
+# Scenarios.
+# ----------------------------------------------------------------------------#
+
+# The statement count metrics reports in each response's Server-Timing header
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+@contextlib.contextmanager
+def scenario_app(database):
+    """The app, in its context, on an empty database (by default a temporary
+    SQLite file), with the view cache off so every request reads the database.
+    """
+    from app import create_app
+    from models import db, Venue, Artist
+
+    with tempfile.TemporaryDirectory(prefix="fyyur-bench-") as folder:
+        app = create_app(
+            {
+                "SQLALCHEMY_DATABASE_URI": database or f"sqlite:///{folder}/bench.db",
+                "CACHE_BACKEND": "none",
+                "SERVER_TIMING": True,
+                "SLOW_REQUEST_SECONDS": float("inf"),
+                "WTF_CSRF_ENABLED": False,
+            }
+        )
+
+        with app.app_context():
+            db.create_all()
+            if (
+                db.session.query(Venue.id).first()
+                or db.session.query(Artist.id).first()
+            ):
+                raise click.ClickException(
+                    "The scenarios need an empty database; this one has records."
+                )
+            db.session.rollback()
+            try:
+                yield app
+            finally:
+                db.session.remove()
+                db.engine.dispose()
+
+
+def load(kind, records):
+    """Inserts records as `flask fyyur import` does, without its progress lines"""
+    from commands import load_records
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        load_records(kind, records, 5000)
+
+
+def time_request(client, method, path, repeat, data=None):
+    """(median milliseconds, SQL statements) of repeat requests for path"""
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.open(path, method=method, data=data)
+        timings.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            raise click.ClickException(f"{method} {path}: {response.status}")
+
+    queries = SERVER_TIMING_QUERIES.search(response.headers["Server-Timing"])
+    return statistics.median(timings) * 1000, int(queries.group(1))
+
+
+@cli.command("venues")
+@click.option("--sizes", default="100,1000,10000,100000", show_default=True)
+@click.option("--shows", default=5, show_default=True, help="Per venue.")
+@click.option("--repeat", default=10, show_default=True)
+@click.option("--seed", default=1, show_default=True)
+@click.option("--database", help="Empty database URL (default: temporary SQLite).")
+def venues_scenario(sizes, shows, repeat, seed, database):
+    """/venues statements and latency as the venue count grows.
+
+    Venues (with --shows shows each) are added up to each of --sizes in
+    turn, and the page timed at every size. Its statement count should stay
+    the same, and its time per venue listed roughly flat: the page is built
+    from one grouped query rather than a count per venue.
+    """
+    from generate import generate_artists, generate_shows, generate_venues
+    from models import db, Venue
+
+    rng = random.Random(seed)
+    anchor = datetime.utcnow().date()
+    sizes = sorted(int(size) for size in sizes.split(","))
+
+    with scenario_app(database) as app:
+        client = app.test_client()
+        load("artists", generate_artists(rng, 1000, 1))
+
+        click.echo(f"{'venues':>10}{'statements':>12}{'p50 ms':>10}{'µs/venue':>10}")
+        last_id = 0
+        for size in sizes:
+            new_ids = range(last_id + 1, size + 1)
+            load("venues", generate_venues(rng, len(new_ids), new_ids.start))
+            load(
+                "shows",
+                generate_shows(
+                    rng, len(new_ids) * shows, new_ids, range(1, 1001), anchor
+                ),
+            )
+            last_id = size
+
+            count = db.session.query(db.func.count(Venue.id)).scalar()
+            db.session.rollback()
+            ms, queries = time_request(client, "GET", "/venues", repeat)
+            click.echo(f"{count:>10}{queries:>12}{ms:>10.1f}{ms * 1000 / count:>10.1f}")
+
+
+@cli.command("search")
+@click.option("--rows", default=1000000, show_default=True, help="Artists.")
+@click.option("--repeat", default=20, show_default=True)
+@click.option("--seed", default=1, show_default=True)
+@click.option("--database", help="Empty database URL (default: temporary SQLite).")
+def search_scenario(rows, repeat, seed, database):
+    """Artist name search latency over --rows artists.
+
+    Each search term is looked up --repeat times through search_names, and
+    once as the /artists/search page. The trigram GiST index serving the
+    lookups nearest first exists on Postgres only: for the indexed numbers,
+    pass --database an empty Postgres database migrated with `flask db
+    upgrade`. On SQLite the lookups scan every name.
+    """
+    from generate import generate_artists
+    from models import db, Artist
+    from search import search_names
+
+    rng = random.Random(seed)
+
+    with scenario_app(database) as app:
+        client = app.test_client()
+        load("artists", generate_artists(rng, rows, 1))
+        count = db.session.query(db.func.count(Artist.id)).scalar()
+        click.echo(f"{count} artists on {db.engine.dialect.name}")
+
+        click.echo(
+            f"{'term':<10}{'matches':>9}{'p50 ms':>9}{'p95 ms':>9}{'page ms':>9}"
+        )
+        for term in ARTIST_TERMS:
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                matches = search_names(Artist, term)
+                timings.append((time.perf_counter() - started) * 1000)
+                db.session.rollback()
+            timings.sort()
+
+            page_ms, _ = time_request(
+                client, "POST", "/artists/search", 1, {"search_term": term}
+            )
+            click.echo(
+                f"{term:<10}{len(matches):>9}{percentile(timings, 0.5):>9.2f}"
+                f"{percentile(timings, 0.95):>9.2f}{page_ms:>9.2f}"
+            )
+
+
+@cli.command("datetime")
+@click.option("--tiles", default=5000, show_default=True)
+@click.option("--runs", default=5, show_default=True, help="Best of.")
+@click.option("--seed", default=1, show_default=True)
+def datetime_scenario(tiles, runs, seed):
+    """Per-tile cost of the show tiles' datetime filter.
+
+    format_datetime on datetimes, with its formatted values cached (warm) and
+    not yet (cold), against the ISO-string parse and uncompiled Babel format
+    the filter used to run for every tile.
+    """
+    import babel.dates
+    import dateutil.parser
+
+    from app import DATETIME_FORMATS, format_datetime
+
+    rng = random.Random(seed)
+    today = datetime.utcnow().date()
+    values = [
+        datetime.combine(
+            today + timedelta(days=rng.randrange(-365, 180)),
+            clock(rng.randrange(18, 24), rng.choice((0, 30))),
+        )
+        for _ in range(tiles)
+    ]
+    strings = [value.strftime("%Y-%m-%dT%H:%M:%S.%fZ") for value in values]
+
+    def parsed():
+        for value in strings:
+            babel.dates.format_datetime(
+                dateutil.parser.parse(value), DATETIME_FORMATS["medium"], locale="en"
+            )
+
+    def cold():
+        format_datetime.cache_clear()
+        for value in values:
+            format_datetime(value)
+
+    def warm():
+        for value in values:
+            format_datetime(value)
+
+    click.echo(f"{tiles} tiles, {len(set(values))} distinct times")
+    baseline = None
+    for name, run in (("parse + Babel", parsed), ("cold", cold), ("warm", warm)):
+        best = float("inf")
+        for _ in range(runs):
+            started = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - started)
+
+        per_tile = best / tiles * 1e6
+        baseline = baseline or per_tile
+        click.echo(f"{name:<14}{per_tile:>9.2f} µs/tile{baseline / per_tile:>8.1f}x")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,270 @@
+import os
+import pickle
+import sqlite3
+import stat
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import aio
+from replicas import replicas
+
+# ----------------------------------------------------------------------------#
+# Backends.
+# ----------------------------------------------------------------------------#
+
+
+def private_directory(path):
+    """Creates path as a directory only this user can open, or checks that it is.
+
+    What is read back from cache files (pickles, template bytecode) runs as
+    code, so a directory another user could have created or written to is
+    refused with a RuntimeError rather than used.
+    """
+
+    try:
+        os.makedirs(path, mode=0o700)
+    except FileExistsError:
+        pass
+
+    info = os.lstat(path)
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.geteuid()
+        or info.st_mode & 0o077
+    ):
+        raise RuntimeError(
+            f"{path} must be a directory owned by this user with mode 0700"
+        )
+    return path
+
+
+class MemoryBackend:
+    """Per-process dict backend, for a single worker or tests.
+
+    Holds at most max_entries keys, evicting the least recently used, and
+    drops expired entries as it comes across them.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.data = OrderedDict()
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.time()
+        found = {}
+        with self.lock:
+            for key in keys:
+                entry = self.data.get(key)
+                if entry is None:
+                    continue
+                if entry[1] <= now:
+                    del self.data[key]
+                    continue
+                self.data.move_to_end(key)
+                found[key] = entry[0]
+        return found
+
+    def store(self, key, value, expires):
+        self.data[key] = (value, expires)
+        self.data.move_to_end(key)
+        while len(self.data) > self.max_entries:
+            self.data.popitem(last=False)
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.store(key, value, time.time() + timeout)
+
+    def add(self, key, value, timeout):
+        now = time.time()
+        with self.lock:
+            if key in self.data and self.data[key][1] > now:
+                return False
+            self.store(key, value, now + timeout)
+            return True
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+class SQLiteBackend:
+    """Backend in a local SQLite file, shared by every worker on the host.
+
+    Each thread (and forked worker) opens its own WAL-mode connection. The
+    file's directory must be private to the user the workers run as, since
+    its values are unpickled.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.writes = 0
+
+    @property
+    def connection(self):
+        if getattr(self.local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value BLOB, expires REAL)"
+            )
+            self.local.connection, self.local.pid = connection, os.getpid()
+        return self.local.connection
+
+    def get_many(self, keys):
+        keys = list(keys)
+        rows = self.connection.execute(
+            f"SELECT key, value FROM cache WHERE expires > ? "
+            f"AND key IN ({','.join('?' * len(keys))})",
+            [time.time(), *keys],
+        )
+        return {key: pickle.loads(value) for key, value in rows}
+
+    def set(self, key, value, timeout):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO cache VALUES (?, ?, ?)",
+            (key, pickle.dumps(value), time.time() + timeout),
+        )
+
+        self.writes += 1
+        if self.writes % 1000 == 0:
+            self.connection.execute(
+                "DELETE FROM cache WHERE expires <= ?", (time.time(),)
+            )
+
+    def add(self, key, value, timeout):
+        now = time.time()
+        cursor = self.connection.execute(
+            "INSERT INTO cache VALUES (?, ?, ?) ON CONFLICT (key) DO UPDATE "
+            "SET value = excluded.value, expires = excluded.expires "
+            "WHERE cache.expires <= ?",
+            (key, pickle.dumps(value), now + timeout, now),
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key):
+        self.connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        self.connection.execute("DELETE FROM cache")
+
+
+# ----------------------------------------------------------------------------#
+# Cache.
+# ----------------------------------------------------------------------------#
+
+
+class Cache:
+    """Caches view data, invalidated by tag and computed once per miss.
+
+    Each entry records the version of every tag it depends on (e.g.
+    "venue:3", "shows"). Write handlers call invalidate() with the tags they
+    affect, which gives those tags new versions so every dependent entry is
+    treated as a miss. While one caller computes a missing entry, holding a
+    lock key in the backend, concurrent callers for the same key, in any
+    worker sharing the backend, wait for its result instead of querying the
+    database themselves.
+    """
+
+    def __init__(self):
+        self.backend = None
+
+    def init_app(self, app):
+        backend = app.config["CACHE_BACKEND"]
+        if backend == "sqlite":
+            path = app.config["CACHE_PATH"] or os.path.join(
+                app.instance_path, "cache", "views.sqlite3"
+            )
+            private_directory(os.path.dirname(path))
+            self.backend = SQLiteBackend(path)
+        elif backend == "memory":
+            self.backend = MemoryBackend(app.config["CACHE_MAX_ENTRIES"])
+        else:
+            self.backend = None
+
+        self.timeout = app.config["CACHE_TIMEOUT"]
+        self.lock_timeout = app.config["CACHE_LOCK_TIMEOUT"]
+        self.replica_timeout = app.config["REPLICA_STICKY_SECONDS"]
+
+    def tag_versions(self, tags):
+        keys = [f"tag:{tag}" for tag in tags]
+        versions = self.backend.get_many(keys)
+        return {key: versions.get(key) for key in keys}
+
+    def lookup(self, key):
+        entry = self.backend.get_many([key]).get(key)
+        if entry is None:
+            return None
+
+        value, versions, replica = entry
+        if self.tag_versions(tag[4:] for tag in versions) != versions:
+            return None
+        return entry
+
+    def memoize(self, key, tags, compute):
+        """Returns the cached value for key, computing it with compute() on a miss.
+
+        Entries computed on a read replica may predate a write the replica
+        hasn't caught up with, so only requests reading a replica themselves
+        are served them; a client reading the primary (e.g. after its own
+        write) recomputes and replaces them. A replica entry is not stored at
+        all if its tags were invalidated while it was computed, and is only
+        kept for REPLICA_STICKY_SECONDS.
+        """
+
+        if self.backend is None:
+            return compute()
+
+        key = f"data:{key}"
+        lock = f"lock:{key}"
+        deadline = time.time() + self.lock_timeout
+        delay = 0.005
+        on_replica = replicas.reading_replica()
+
+        while True:
+            entry = self.lookup(key)
+            if entry is not None and (on_replica or not entry[2]):
+                return entry[0]
+
+            if self.backend.add(lock, uuid.uuid4().hex, self.lock_timeout):
+                try:
+                    # Versions are read before the data, so a write landing
+                    # mid-compute leaves this entry stale rather than current
+                    versions = self.tag_versions(tags)
+                    value = compute()
+                    timeout = self.timeout
+                    if on_replica:
+                        if self.tag_versions(tags) != versions:
+                            return value
+                        timeout = min(timeout, self.replica_timeout)
+                    self.backend.set(key, (value, versions, on_replica), timeout)
+                    return value
+                finally:
+                    self.backend.delete(lock)
+
+            if time.time() > deadline:
+                return compute()
+            aio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    def invalidate(self, *tags):
+        if self.backend is None:
+            return
+        for tag in tags:
+            self.backend.set(f"tag:{tag}", uuid.uuid4().hex, self.timeout * 2)
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+
+cache = Cache()
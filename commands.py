@@ -0,0 +1,581 @@
+import csv
+import json
+import random
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import groupby, islice
+
+import click
+from flask import current_app, url_for
+from flask.cli import AppGroup
+
+from assets import build_assets
+from cache import cache
+from counters import sweep, recount
+from export import EXPORT_FORMATS, EXPORT_KINDS
+from metrics import metrics, QueryBudgetExceeded
+from records import (
+    normalize_venue,
+    normalize_artist,
+    normalize_show,
+    VENUE_UNIQUE,
+    ARTIST_UNIQUE,
+)
+from models import db, Venue, Artist, Show, Genre, GENRE_OWNERS
+from queries import (
+    past_shows,
+    upcoming_shows,
+    venue_shows,
+    artist_shows,
+    all_shows,
+)
+
+fyyur_cli = AppGroup("fyyur", help="Fyyur maintenance commands.")
+
+# ----------------------------------------------------------------------------#
+# Query plans.
+# ----------------------------------------------------------------------------#
+
+# A full table scan of Show, as reported by Postgres EXPLAIN or SQLite's
+# EXPLAIN QUERY PLAN ("SCAN Show USING ... INDEX" is an ordered index walk)
+SHOW_SEQ_SCAN = re.compile(r'Seq Scan on "?Show"?|SCAN (TABLE )?"?Show"?(?! USING)')
+
+
+def hot_queries(now):
+    """The Show queries behind /shows, the venue/artist pages and the sweep"""
+
+    venue_id = db.session.query(Show.venue_id).limit(1).scalar()
+    artist_id = db.session.query(Show.artist_id).limit(1).scalar()
+
+    return {
+        "show_venue past": past_shows(venue_shows(venue_id), now),
+        "show_venue upcoming": upcoming_shows(venue_shows(venue_id), now),
+        "show_artist past": past_shows(artist_shows(artist_id), now),
+        "show_artist upcoming": upcoming_shows(artist_shows(artist_id), now),
+        "shows": all_shows(),
+        "sweep": db.session.query(Show.venue_id)
+        .filter(Show.start_time > now - timedelta(minutes=1), Show.start_time <= now)
+        .distinct(),
+    }
+
+
+def explain(query):
+    """Returns the database's query plan for query, one line per plan node"""
+
+    connection = db.session.connection()
+    dialect = connection.dialect
+    compiled = query.statement.compile(dialect=dialect)
+    params = compiled.construct_params()
+    if compiled.positional:
+        params = tuple(params[key] for key in compiled.positiontup)
+
+    if dialect.name == "postgresql":
+        # Small seeded tables are cheaper to scan; ask whether an index *can* be used
+        connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        prefix = "EXPLAIN "
+    else:
+        prefix = "EXPLAIN QUERY PLAN "
+
+    rows = connection.exec_driver_sql(prefix + str(compiled), params)
+    return [row[-1] for row in rows]
+
+
+@fyyur_cli.command("explain")
+def explain_command():
+    """Fail if a hot query falls back to a sequential scan of Show."""
+
+    failed = False
+
+    for name, query in hot_queries(datetime.utcnow()).items():
+        plan = explain(query)
+        scans = [line for line in plan if SHOW_SEQ_SCAN.search(line)]
+        click.echo(f"{'FAIL' if scans else 'ok'}  {name}")
+        for line in plan:
+            click.echo(f"      {line}")
+        failed = failed or bool(scans)
+
+    db.session.rollback()
+    if failed:
+        sys.exit(1)
+
+
+# ----------------------------------------------------------------------------#
+# Query budgets.
+# ----------------------------------------------------------------------------#
+
+
+def budgeted_requests(app):
+    """(method, url) of every view with a @query_budget, on the first records.
+
+    Budgeted POST views are the searches, which are sent a one-letter term.
+    """
+
+    ids = {
+        "venue_id": db.session.query(db.func.min(Venue.id)).scalar(),
+        "artist_id": db.session.query(db.func.min(Artist.id)).scalar(),
+    }
+
+    with app.test_request_context():
+        for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.rule):
+            view = app.view_functions[rule.endpoint]
+            if not hasattr(view, "query_budget") or not rule.arguments <= ids.keys():
+                continue
+            url = url_for(rule.endpoint, **{key: ids[key] for key in rule.arguments})
+            yield ("GET" if "GET" in rule.methods else "POST"), url
+
+
+@fyyur_cli.command("queries")
+def queries_command():
+    """Fail if a page runs over its query budget or repeats a statement."""
+
+    app = current_app._get_current_object()
+    client = app.test_client()
+    failed = False
+
+    # Every page is rendered from the database, not the view cache, with
+    # budget violations raised through the test client
+    backend, cache.backend = cache.backend, None
+    mode, metrics.budget_mode = metrics.budget_mode, "raise"
+    testing, app.testing = app.testing, True
+
+    try:
+        for method, url in budgeted_requests(app):
+            try:
+                client.open(url, method=method, data={"search_term": "a"})
+                click.echo(f"ok    {method} {url}")
+            except QueryBudgetExceeded as e:
+                click.echo(f"FAIL  {e}")
+                failed = True
+    finally:
+        cache.backend, metrics.budget_mode, app.testing = backend, mode, testing
+
+    if failed:
+        sys.exit(1)
+
+
+# ----------------------------------------------------------------------------#
+# Startup.
+# ----------------------------------------------------------------------------#
+
+# Run in a fresh interpreter: prints the seconds `import app; create_app()`
+# took, then the LAZY_MODULES it loaded
+STARTUP_PROBE = """
+import sys, time
+start = time.perf_counter()
+import app
+app.create_app()
+print(time.perf_counter() - start)
+print(*(name for name in sys.argv[1:] if name in sys.modules))
+"""
+
+
+def probe_startup(app, importtime=False):
+    """(seconds, lazy modules loaded, -X importtime report) of one cold start"""
+
+    # As a worker boots, not under the flask command nor preloading
+    env = dict(os.environ, FYYUR_PRELOAD="0")
+    env.pop("FLASK_RUN_FROM_CLI", None)
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", STARTUP_PROBE, *app.config["LAZY_MODULES"]]
+
+    result = subprocess.run(
+        command, cwd=app.root_path, env=env, capture_output=True, text=True
+    )
+    if result.returncode:
+        raise click.ClickException(f"create_app() failed:\n{result.stderr}")
+    seconds, loaded = result.stdout.splitlines()[-2:]
+    return float(seconds), loaded.split(), result.stderr
+
+
+def slowest_imports(report, count=10):
+    """The modules app.py imports directly that took longest, with their imports"""
+
+    # "import time: self [us] | cumulative | <indent>name"; app's own imports
+    # are indented one level deeper than app
+    rows = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if name.startswith("   ") and not name.startswith("    "):
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+@fyyur_cli.command("startup")
+@click.option("--runs", default=5, show_default=True)
+def startup_command(runs):
+    """Fail if a cold import of the app and create_app() run over budget."""
+
+    app = current_app._get_current_object()
+    budget = app.config["STARTUP_BUDGET_SECONDS"]
+
+    # The fastest run is the one least slowed by whatever else the machine ran
+    timings = []
+    for _ in range(runs):
+        seconds, loaded, _ = probe_startup(app)
+        timings.append(seconds)
+    fastest = min(timings)
+    click.echo(
+        f"import app + create_app(): {fastest:.3f}s fastest of {runs}"
+        f" (median {statistics.median(timings):.3f}s, budget {budget:.3f}s)"
+    )
+
+    failed = False
+    if loaded:
+        click.echo(f"FAIL  loaded on startup: {', '.join(loaded)}")
+        failed = True
+    if fastest > budget:
+        click.echo("FAIL  over budget; slowest imports of app.py:")
+        for cumulative, name in slowest_imports(probe_startup(app, True)[2]):
+            click.echo(f"  {cumulative / 1e6:8.3f}s  {name}")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+# ----------------------------------------------------------------------------#
+# Bulk import.
+# ----------------------------------------------------------------------------#
+
+
+def read_records(path):
+    """Yields dicts from a CSV file (with header row) or an NDJSON file"""
+
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def batched(records, size):
+    records = iter(records)
+    while batch := list(islice(records, size)):
+        yield batch
+
+
+def import_records(connection, model, unique, batch, seen):
+    """Inserts the venues/artists of batch not already in the table or file"""
+
+    cols = [getattr(model, c) for c in unique]
+    keys = {tuple(row.get(c) for c in unique) for row in batch} - seen
+    existing = set()
+    if keys:
+        query = db.select(*cols).where(db.tuple_(*cols).in_(keys))
+        existing.update(tuple(row) for row in connection.execute(query))
+
+    rows = []
+    for row in batch:
+        key = tuple(row.get(c) for c in unique)
+        if key not in seen and key not in existing:
+            seen.add(key)
+            rows.append(row)
+
+    # Genres go to the link table once the rows have ids
+    genres = [row.pop("genres", None) or [] for row in rows]
+
+    # executemany needs the same columns on every row, e.g. with or without id
+    for _, group in groupby(rows, key=lambda row: sorted(row)):
+        connection.execute(model.__table__.insert(), list(group))
+
+    if any(genres):
+        link_genres(connection, model, unique, rows, genres)
+    return len(rows)
+
+
+def genre_ids(connection, names):
+    """Genre ids by lower-cased name, creating the genres not in the table"""
+
+    folded = db.func.lower(Genre.name)
+    query = db.select(folded, Genre.id).where(folded.in_(list(names)))
+
+    ids = dict(connection.execute(query).all())
+    missing = [{"name": name} for key, name in names.items() if key not in ids]
+    if missing:
+        connection.execute(Genre.__table__.insert(), missing)
+        ids = dict(connection.execute(query).all())
+    return ids
+
+
+def link_genres(connection, model, unique, rows, genres):
+    """Links just-inserted venues/artists to their genres"""
+
+    names = {name.lower(): name for row_genres in genres for name in row_genres}
+    ids = genre_ids(connection, names)
+
+    # Rows imported without an id are found again by their unique columns
+    keys = {tuple(row.get(c) for c in unique) for row in rows if "id" not in row}
+    row_ids = {}
+    if keys:
+        cols = [getattr(model, c) for c in unique]
+        query = db.select(model.id, *cols).where(db.tuple_(*cols).in_(keys))
+        row_ids = {tuple(row[1:]): row[0] for row in connection.execute(query)}
+
+    owner = GENRE_OWNERS[model.__tablename__]
+    links = []
+    for row, row_genres in zip(rows, genres):
+        id = row.get("id") or row_ids.get(tuple(row.get(c) for c in unique))
+        if id is not None:
+            links.extend(
+                {owner.name: id, "genre_id": ids[name.lower()]} for name in row_genres
+            )
+    if links:
+        connection.execute(owner.table.insert(), links)
+
+
+# Shows are staged in a temporary table and copied across with one
+# INSERT ... SELECT per batch, which drops duplicates and shows whose artist or
+# venue does not exist inside the database.
+show_staging = db.Table(
+    "Show_import",
+    db.MetaData(),
+    db.Column("artist_id", db.Integer),
+    db.Column("venue_id", db.Integer),
+    db.Column("start_time", db.DateTime),
+    prefixes=["TEMPORARY"],
+)
+
+
+def import_shows(connection, model, unique, batch, seen):
+    staged = show_staging.c
+
+    connection.execute(show_staging.delete())
+    connection.execute(show_staging.insert(), batch)
+
+    rows = (
+        db.select(staged.artist_id, staged.venue_id, staged.start_time)
+        .distinct()
+        .where(db.exists().where(Artist.id == staged.artist_id))
+        .where(db.exists().where(Venue.id == staged.venue_id))
+        .where(
+            ~db.exists().where(
+                Show.artist_id == staged.artist_id,
+                Show.venue_id == staged.venue_id,
+                Show.start_time == staged.start_time,
+            )
+        )
+    )
+    result = connection.execute(
+        Show.__table__.insert().from_select(
+            ["artist_id", "venue_id", "start_time"], rows
+        )
+    )
+    return result.rowcount
+
+
+def reset_id_sequence(connection, model):
+    """Moves a Postgres serial past explicitly imported ids"""
+
+    if connection.dialect.name == "postgresql":
+        table = model.__tablename__
+        connection.execute(
+            db.text(
+                f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+                f'COALESCE(MAX(id), 1)) FROM "{table}"'
+            )
+        )
+
+
+IMPORTS = {
+    "venues": (Venue, normalize_venue, VENUE_UNIQUE, import_records),
+    "artists": (Artist, normalize_artist, ARTIST_UNIQUE, import_records),
+    "shows": (Show, normalize_show, None, import_shows),
+}
+
+
+def load_records(kind, records, batch_size):
+    """Normalises and inserts venue, artist or show records, a batch at a time"""
+
+    model, normalize, unique, insert = IMPORTS[kind]
+    seen = set()
+    read = inserted = 0
+    started = time.perf_counter()
+
+    with db.engine.connect() as connection:
+        if model is Show:
+            show_staging.create(connection)
+
+        for records in batched(records, batch_size):
+            batch = [normalize(record) for record in records]
+            with connection.begin():
+                inserted += insert(connection, model, unique, batch, seen)
+            read += len(batch)
+
+            elapsed = time.perf_counter() - started
+            click.echo(
+                f"{kind}: {read} read, {inserted} inserted ({read / elapsed:.0f} rows/s)"
+            )
+
+        with connection.begin():
+            if model is Show:
+                show_staging.drop(connection)
+                recount(connection, datetime.utcnow())
+            else:
+                reset_id_sequence(connection, model)
+
+    # Imported rows can land on any listing or detail page
+    cache.clear()
+
+    elapsed = time.perf_counter() - started
+    click.echo(
+        f"{kind}: {inserted} inserted, {read - inserted} skipped in {elapsed:.1f}s "
+        f"({read / max(elapsed, 1e-9):.0f} rows/s)"
+    )
+
+
+@fyyur_cli.command("import")
+@click.argument("kind", type=click.Choice(sorted(IMPORTS)))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--batch-size", default=5000, show_default=True)
+def import_command(kind, path, batch_size):
+    """Bulk-load venues, artists or shows from a CSV or NDJSON file.
+
+    Rows get the same normalisation and duplicate checks as the create forms,
+    and are inserted in executemany batches of --batch-size, each committed
+    on its own.
+    """
+
+    load_records(kind, read_records(path), batch_size)
+
+
+@fyyur_cli.command("generate")
+@click.option("--venues", default=1000, show_default=True)
+@click.option("--artists", default=10000, show_default=True)
+@click.option("--shows", default=100000, show_default=True)
+@click.option("--seed", default=1, show_default=True)
+@click.option(
+    "--anchor",
+    type=click.DateTime(["%Y-%m-%d"]),
+    help="Day show dates are spread around (default: today).",
+)
+@click.option("--upcoming-share", default=0.1, show_default=True)
+@click.option("--batch-size", default=5000, show_default=True)
+def generate_command(venues, artists, shows, seed, anchor, upcoming_share, batch_size):
+    """Load a synthetic catalogue, e.g. for benchmarks.
+
+    The same --seed and --anchor generate the same catalogue. Venue and
+    artist ids continue from the highest in the database, and the shows are
+    spread over the generated venues and artists only.
+    """
+    # generate loads the forms, for their genre list
+    from generate import generate_venues, generate_artists, generate_shows
+
+    rng = random.Random(seed)
+    anchor = (anchor or datetime.utcnow()).date()
+    first_venue = (db.session.query(db.func.max(Venue.id)).scalar() or 0) + 1
+    first_artist = (db.session.query(db.func.max(Artist.id)).scalar() or 0) + 1
+    db.session.rollback()
+
+    load_records("venues", generate_venues(rng, venues, first_venue), batch_size)
+    load_records("artists", generate_artists(rng, artists, first_artist), batch_size)
+    load_records(
+        "shows",
+        generate_shows(
+            rng,
+            shows,
+            range(first_venue, first_venue + venues),
+            range(first_artist, first_artist + artists),
+            anchor,
+            upcoming_share,
+        ),
+        batch_size,
+    )
+
+
+# ----------------------------------------------------------------------------#
+# Show counters.
+# ----------------------------------------------------------------------------#
+
+
+@fyyur_cli.command("sweep")
+@click.option("--every", type=float, help="Keep sweeping, every this many seconds.")
+@click.option("--recount", "full", is_flag=True, help="Recompute every counter.")
+def sweep_command(every, full):
+    """Move started shows from the upcoming to the past show counters.
+
+    Run it every minute or so (from cron, or with --every 60) to keep the
+    venue and artist counters close to the clock. --recount rebuilds them
+    from the Show table instead.
+    """
+
+    while True:
+        started = time.perf_counter()
+
+        with db.engine.begin() as connection:
+            if full:
+                recount(connection, datetime.utcnow())
+            else:
+                moved = sweep(connection, datetime.utcnow())
+
+        if full:
+            cache.clear()
+            click.echo(f"counters recounted in {time.perf_counter() - started:.2f}s")
+        else:
+            tags = [f"venue:{id}" for id in moved.get(Venue, [])]
+            tags += [f"artist:{id}" for id in moved.get(Artist, [])]
+            if tags:
+                cache.invalidate("venues", "artists", *tags)
+            click.echo(
+                f"swept {len(tags)} venues/artists "
+                f"in {time.perf_counter() - started:.2f}s"
+            )
+
+        if not every:
+            break
+        time.sleep(every)
+
+
+# ----------------------------------------------------------------------------#
+# Export.
+# ----------------------------------------------------------------------------#
+
+
+@fyyur_cli.command("export")
+@click.argument("kind", type=click.Choice(EXPORT_KINDS))
+@click.option("--format", type=click.Choice(sorted(EXPORT_FORMATS)), default="ndjson")
+@click.option("-o", "--output", default="-", help="Output file (default: stdout).")
+def export_command(kind, format, output):
+    """Stream venues, artists or shows to NDJSON or CSV in constant memory."""
+
+    lines, _ = EXPORT_FORMATS[format]
+    with click.open_file(output, "w", encoding="utf-8", lazy=True) as f:
+        for chunk in lines(kind):
+            f.write(chunk)
+
+
+# ----------------------------------------------------------------------------#
+# Static assets.
+# ----------------------------------------------------------------------------#
+
+
+@fyyur_cli.command("assets")
+def assets_command():
+    """Build the bundled, hashed and precompressed static assets."""
+
+    app = current_app._get_current_object()
+    manifest, rows = build_assets(
+        app.static_folder,
+        app.config["ASSET_BUNDLES"],
+        app.config["ASSET_IMAGE_MAX_WIDTH"],
+        app.config["ASSET_JPEG_QUALITY"],
+    )
+
+    click.echo(f"{'asset':<40}{'source':>10}{'built':>10}{'gzip':>10}{'br':>10}")
+    for name, source, built, variants in rows:
+        sizes = [variants.get(encoding, "-") for encoding in ("gzip", "br")]
+        click.echo(f"{name:<40}{source:>10}{built:>10}{sizes[0]:>10}{sizes[1]:>10}")
+    click.echo(
+        f"{len(manifest['files'])} files and {len(manifest['bundles'])} bundles"
+        f" built in {os.path.join(app.static_folder, 'dist')}"
+    )
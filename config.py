@@ -1,14 +1,216 @@
 import os
 
-SECRET_KEY = os.urandom(32)
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def env_flag(name, default):
+    value = os.environ.get(name)
+    if not value:
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+# Deployment profile: "development" (the default) or "production". Every
+# setting below that reads the environment can also be set on its own.
+ENV_PROFILE = os.environ.get("FYYUR_ENV", "development")
+PRODUCTION = ENV_PROFILE == "production"
+
+# Workers must share the secret key in production, or sessions, CSRF tokens
+# and image proxy links signed by one are rejected by the others: create_app()
+# refuses to start without one in production, and makes up one per process
+# in development.
+SECRET_KEY = os.environ.get("SECRET_KEY")
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 # Enable debug mode.
-DEBUG = True
+DEBUG = env_flag("FYYUR_DEBUG", not PRODUCTION)
 
 # Connect to the database
+SQLALCHEMY_DATABASE_URI = os.environ.get(
+    "DATABASE_URL", "postgresql://postgres@127.0.0.1:5432/fyyur"
+)
+
+# Read replicas, as comma-separated URLs in DATABASE_REPLICA_URLS (e.g. a
+# copy of a local SQLite primary). Read-only views read from one of them,
+# except for a client that wrote in the last REPLICA_STICKY_SECONDS, which
+# should exceed the replicas' usual lag.
+DATABASE_REPLICA_URIS = [
+    url.strip()
+    for url in os.environ.get("DATABASE_REPLICA_URLS", "").split(",")
+    if url.strip()
+]
+REPLICA_STICKY_SECONDS = env_int("FYYUR_REPLICA_STICKY_SECONDS", 10)
+
+# Async serving (`uvicorn asgi:app`): the views of ASYNC_ENDPOINTS run on the
+# event loop, reading through an async driver (asyncpg or aiosqlite), at
+# DATABASE_ASYNC_URL or by default the same database as DATABASE_URL; every
+# other request runs on one of ASYNC_SYNC_THREADS threads with the sync
+# driver. Set FYYUR_WORKER_CLASS=async to size the sync pool for it.
+DATABASE_ASYNC_URL = os.environ.get("DATABASE_ASYNC_URL")
+ASYNC_ENDPOINTS = [
+    endpoint.strip()
+    for endpoint in os.environ.get(
+        "FYYUR_ASYNC_ENDPOINTS", "pages.show_venue,pages.show_artist,pages.shows"
+    ).split(",")
+    if endpoint.strip()
+]
+ASYNC_SYNC_THREADS = env_int("FYYUR_ASYNC_SYNC_THREADS", 4)
+
+# Connection pool, per worker process. The worker model sets the defaults
+# (see engine.POOL_DEFAULTS): "sync" holds a connection per request thread,
+# so the pool matches WORKER_THREADS; "gevent" and "async" serve many more
+# concurrent requests than the database takes connections, so they get a
+# larger pool with overflow and give up on a checkout sooner. Any DB_POOL_*
+# left as None takes the worker model's default.
+WORKER_CLASS = os.environ.get("FYYUR_WORKER_CLASS", "sync")
+WORKER_THREADS = env_int("FYYUR_WORKER_THREADS", 4)
+DB_POOL_SIZE = env_int("FYYUR_DB_POOL_SIZE", None)
+DB_MAX_OVERFLOW = env_int("FYYUR_DB_MAX_OVERFLOW", None)
+DB_POOL_TIMEOUT = env_int("FYYUR_DB_POOL_TIMEOUT", None)
+# Seconds before a connection is replaced, kept under the server's (or a
+# proxy's) idle timeout; pre-ping tests each connection on checkout so one
+# dropped by a database restart or failover is replaced instead of failing
+# the request
+DB_POOL_RECYCLE = env_int("FYYUR_DB_POOL_RECYCLE", 1800)
+DB_POOL_PRE_PING = env_flag("FYYUR_DB_POOL_PRE_PING", PRODUCTION)
+# Milliseconds a statement may run before Postgres cancels it (0: no limit;
+# set it to 0 for bulk `flask fyyur import` runs)
+DB_STATEMENT_TIMEOUT = env_int("FYYUR_DB_STATEMENT_TIMEOUT", 5000 if PRODUCTION else 0)
+
+# Number of past / upcoming shows listed per "show more" page on venue and
+# artist pages. Their headings come from the venue and artist show counters,
+# which `flask fyyur sweep` moves from upcoming to past: run it every minute
+# (from cron, or as `flask fyyur sweep --every 60`), or the popular sorts and
+# /venues counts drift further behind the clock between sweeps.
+PAST_SHOWS_LIMIT = 20
+UPCOMING_SHOWS_LIMIT = 50
+# Most "show more" pages a venue or artist page lists (so at most 200 past
+# and 500 upcoming shows)
+SHOWS_MAX_PAGES = 10
+
+# Maximum number of venues / artists returned by a search
+SEARCH_RESULTS_LIMIT = 50
+
+# In-memory typeahead index (/search/suggest): names indexed per process,
+# characters indexed per name, and suggestions returned per query. Each name
+# costs about 1.6kB with its grams and postings (measured over 22k generated
+# names), so the default keeps the index near 40MB per worker.
+SUGGEST_MAX_ENTRIES = 25000
+SUGGEST_MAX_NAME_LENGTH = 64
+SUGGEST_RESULTS_LIMIT = 10
+# How often a worker checks whether venues or artists changed outside it
+# (other workers, imports), and rebuilds its index if so
+SUGGEST_REFRESH_SECONDS = 30
+
+# JSON API (/api/...) page size: default, and the most a client may ask for
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+
+# Rows per page on /shows and /artists (?all=1 streams every row instead)
+SHOWS_PAGE_SIZE = 60
+ARTISTS_PAGE_SIZE = 100
+
+# Static assets: `flask fyyur assets` builds static/ into static/dist/ (see
+# assets.py), bundling each of ASSET_BUNDLES, scaling images down to
+# ASSET_IMAGE_MAX_WIDTH and recompressing them (with Pillow), and adding brotli
+# variants (with brotli) and minified JS (with rjsmin) where those are
+# installed. With BUILT_ASSETS the pages link and serve the built copies.
+BUILT_ASSETS = env_flag("FYYUR_BUILT_ASSETS", PRODUCTION)
+ASSET_BUNDLES = {
+    "main.css": [
+        "css/bootstrap.min.css",
+        "css/layout.main.css",
+        "css/main.css",
+        "css/main.responsive.css",
+        "css/main.quickfix.css",
+    ],
+    "head.js": [
+        "js/libs/modernizr-2.8.2.min.js",
+        "js/libs/moment.min.js",
+        "js/script.js",
+    ],
+    # Runs after jQuery, which loads from a CDN or the local copy
+    "footer.js": ["js/libs/bootstrap-3.1.1.min.js", "js/plugins.js"],
+}
+ASSET_IMAGE_MAX_WIDTH = 1920
+ASSET_JPEG_QUALITY = 82
+
+# Image proxy (/images/...): pages show venue and artist image_links as
+# thumbnails no larger than THUMBNAIL_SIZES (2x the size they are shown
+# at), WebP to the browsers that ask for it, each link fetched once by
+# IMAGE_FETCHER (default images.fetch_url) and rendered with Pillow. The files
+# are kept in THUMBNAIL_PATH (by default in the app's instance folder, in a
+# directory that must be private to the user the workers run as), shared by
+# the workers on a host, and the least recently served evicted once all of
+# them together pass THUMBNAIL_CACHE_BYTES.
+IMAGE_PROXY = env_flag("FYYUR_IMAGE_PROXY", True)
+IMAGE_FETCHER = os.environ.get("FYYUR_IMAGE_FETCHER")
+THUMBNAIL_PATH = os.environ.get("FYYUR_THUMBNAIL_PATH")
+THUMBNAIL_SIZES = {"tile": (600, 400), "detail": (1000, 1000)}
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_CACHE_BYTES = env_int("FYYUR_THUMBNAIL_CACHE_BYTES", 512 * 2**20)
+THUMBNAIL_MAX_AGE = 7 * 24 * 60 * 60
+
+# Release identifier (e.g. the deployed commit), part of every page's ETag so
+# a deploy invalidates the copies browsers hold; by default a hash of the
+# templates and the built asset manifest (see app.release_version)
+BUILD_VERSION = os.environ.get("FYYUR_BUILD_VERSION")
+
+# View data cache shared by the workers on a host: "sqlite" (file at
+# CACHE_PATH, by default in the app's instance folder, in a directory that
+# must be private to the user the workers run as), "memory" (per process) or
+# "none". Entries live CACHE_TIMEOUT seconds unless a write invalidates them
+# first; concurrent misses wait up to CACHE_LOCK_TIMEOUT seconds for the worker
+# computing the entry. The memory backend keeps at most CACHE_MAX_ENTRIES,
+# evicting the least recently used.
+CACHE_BACKEND = os.environ.get("FYYUR_CACHE_BACKEND", "sqlite")
+CACHE_PATH = os.environ.get("FYYUR_CACHE_PATH")
+CACHE_TIMEOUT = 300
+CACHE_LOCK_TIMEOUT = 10
+CACHE_MAX_ENTRIES = 10000
+
+# Compiled templates, shared by the workers on a host, in
+# JINJA_BYTECODE_CACHE_PATH (by default in the app's instance folder, in a
+# directory that must be private to the user the workers run as), and how many
+# rendered {% cache %} fragments, such as show tiles, each process keeps.
+JINJA_BYTECODE_CACHE = env_flag("FYYUR_JINJA_CACHE", True)
+JINJA_BYTECODE_CACHE_PATH = os.environ.get("FYYUR_JINJA_CACHE_PATH")
+FRAGMENT_CACHE_SIZE = 10000
+
+# Request instrumentation (/metrics): Server-Timing headers with each
+# response's DB, pool wait and template times, and a log line, with the
+# slowest statement, for requests slower than SLOW_REQUEST_SECONDS
+SERVER_TIMING = env_flag("FYYUR_SERVER_TIMING", not PRODUCTION)
+SLOW_REQUEST_SECONDS = 1.0
+
+# /metrics, /db/pool/stats and /search/suggest/stats answer only requests
+# with an "Authorization: Bearer <METRICS_TOKEN>" header; without a token
+# they are open in development and not found in production. Metrics are
+# per worker: with METRICS_PATH (a directory, created if missing), workers
+# share snapshots, written at most every METRICS_FLUSH_SECONDS, so one scrape
+# of any worker reports them all.
+METRICS_TOKEN = os.environ.get("FYYUR_METRICS_TOKEN")
+METRICS_PATH = os.environ.get("FYYUR_METRICS_PATH")
+METRICS_FLUSH_SECONDS = 5
 
+# Query budgets: "off", "log" or "raise" (for tests and `flask fyyur
+# queries`) when a request runs more SQL statements than its view's
+# @query_budget, or the same statement more than QUERY_REPEAT_LIMIT times
+QUERY_BUDGETS = os.environ.get("FYYUR_QUERY_BUDGETS", "off")
+QUERY_REPEAT_LIMIT = 3
 
-# TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = "postgresql://postgres@127.0.0.1:5432/fyyur"
+# Startup: with PRELOAD, create_app() warms the app (see app.warm) for a
+# server that loads it once and forks its workers, e.g.
+# `FYYUR_PRELOAD=1 gunicorn --preload "app:create_app()"`. `flask fyyur
+# startup` fails when a cold import and create_app() take longer than
+# STARTUP_BUDGET_SECONDS, or load one of the LAZY_MODULES.
+PRELOAD = env_flag("FYYUR_PRELOAD", False)
+# Checked against the fastest of a few runs. 30 cold starts on one core took
+# 0.34-0.52s (median 0.47s), against 0.60-0.78s for the app built at import
+# time before the factory; an eager Alembic import alone adds 0.35s.
+STARTUP_BUDGET_SECONDS = 0.6
+LAZY_MODULES = ("alembic", "wtforms", "babel.dates", "dateutil.parser", "PIL")
@@ -0,0 +1,200 @@
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+from models import db, Venue, Artist, Show, show_sweep
+from replicas import RoutingSession
+
+# ----------------------------------------------------------------------------#
+# Show counters.
+# ----------------------------------------------------------------------------#
+
+# Venue.upcoming_shows_count / past_shows_count (and Artist's) split shows at
+# the sweep watermark rather than the current time: a show is upcoming while
+# it starts after the last sweep. Until the first sweep every show counts as
+# upcoming, and that sweep moves the ones already past.
+EPOCH = datetime(1970, 1, 1)
+
+OWNERS = ((Venue, Show.venue_id), (Artist, Show.artist_id))
+
+
+def watermark():
+    """The time counters are current to, as a scalar subquery"""
+
+    return db.select(
+        db.func.coalesce(db.func.max(show_sweep.c.swept_at), EPOCH)
+    ).scalar_subquery()
+
+
+def locked_watermark(connection):
+    """The time counters are current to, locking it (on Postgres) until commit.
+
+    Writers of counters take this lock before anything else, so a show write
+    waits for a running sweep to commit and then counts against its new
+    watermark, rather than against the old one the sweep is moving past.
+    """
+
+    swept = connection.execute(
+        db.select(show_sweep.c.swept_at).with_for_update()
+    ).scalar()
+    return swept, swept or EPOCH
+
+
+def unswept_shows(shows, now):
+    """Shows of a venue_shows/artist_shows query split differently by now than
+    by the counters: (past by now but counted upcoming, the reverse).
+
+    Only shows between the watermark and now are counted, so this stays a
+    short range scan however long the sweep is overdue.
+    """
+
+    swept_at = watermark()
+    return (
+        shows.order_by(None)
+        .with_entities(
+            db.func.count(
+                db.case((db.and_(Show.start_time > swept_at, Show.start_time < now), 1))
+            ),
+            db.func.count(
+                db.case(
+                    (db.and_(Show.start_time <= swept_at, Show.start_time >= now), 1)
+                )
+            ),
+        )
+        .one()
+    )
+
+
+# Flushes of Show through the ORM (the create form, cascades from a venue
+# delete) keep the counters in step in the same transaction. Bulk inserts
+# outside the ORM call recount() instead.
+@event.listens_for(Show, "after_insert")
+def show_inserted(mapper, connection, show):
+    counted_shows(show).append((show, 1))
+
+
+@event.listens_for(Show, "after_delete")
+def show_deleted(mapper, connection, show):
+    counted_shows(show).append((show, -1))
+
+
+def counted_shows(show):
+    return object_session(show).info.setdefault("counted_shows", [])
+
+
+@event.listens_for(RoutingSession, "before_flush")
+def lock_counters(session, flush_context, instances):
+    """Takes the watermark lock before a flush writing shows touches any row"""
+
+    if any(isinstance(record, Show) for record in (*session.new, *session.deleted)):
+        locked_watermark(session.connection())
+
+
+@event.listens_for(RoutingSession, "after_soft_rollback")
+def forget_shows(session, previous_transaction):
+    session.info.pop("counted_shows", None)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def count_shows(session, flush_context):
+    """Applies a flush's show changes to the counters, one UPDATE per model.
+
+    The venue or artist of each show written gets one row of an executemany,
+    however many of its shows the flush wrote.
+    """
+
+    shows = session.info.pop("counted_shows", None)
+    if not shows:
+        return
+
+    connection = session.connection()
+    _, swept_at = locked_watermark(connection)
+
+    for model, owner in OWNERS:
+        deltas = defaultdict(lambda: [0, 0])
+        for show, delta in shows:
+            deltas[getattr(show, owner.key)][show.start_time <= swept_at] += delta
+
+        connection.execute(
+            db.update(model)
+            .where(model.id == db.bindparam("owner_id"))
+            .values(
+                upcoming_shows_count=model.upcoming_shows_count
+                + db.bindparam("upcoming", type_=db.Integer),
+                past_shows_count=model.past_shows_count
+                + db.bindparam("past", type_=db.Integer),
+            ),
+            [
+                {"owner_id": id, "upcoming": upcoming, "past": past}
+                for id, (upcoming, past) in deltas.items()
+            ],
+        )
+
+
+def owned_shows(model, owner, *where):
+    """Count of a venue's or artist's shows, correlated to an UPDATE of model"""
+
+    return db.select(db.func.count()).where(owner == model.id, *where).scalar_subquery()
+
+
+def set_watermark(connection, swept, now):
+    if swept is None:
+        connection.execute(show_sweep.insert().values(swept_at=now))
+    else:
+        connection.execute(show_sweep.update().values(swept_at=now))
+
+
+def sweep(connection, now):
+    """Moves shows started since the last sweep from upcoming to past.
+
+    Only venues and artists with a show in that window are updated, each by
+    a count over its Show timeline index. Returns the ids moved, per model.
+    """
+
+    # Locks the watermark row (on Postgres), so concurrent sweeps queue up
+    # instead of moving the same shows twice, and show writes wait for this
+    # sweep rather than counting against the watermark it replaces
+    swept, swept_at = locked_watermark(connection)
+    if now <= swept_at:
+        return {}
+
+    window = (Show.start_time > swept_at, Show.start_time <= now)
+    moved_ids = {}
+
+    for model, owner in OWNERS:
+        moved_ids[model] = (
+            connection.execute(db.select(owner).where(*window).distinct())
+            .scalars()
+            .all()
+        )
+
+        moved = owned_shows(model, owner, *window)
+        connection.execute(
+            db.update(model)
+            .where(model.id.in_(db.select(owner).where(*window)))
+            .values(
+                upcoming_shows_count=model.upcoming_shows_count - moved,
+                past_shows_count=model.past_shows_count + moved,
+            )
+        )
+
+    set_watermark(connection, swept, now)
+    return moved_ids
+
+
+def recount(connection, now):
+    """Recomputes every counter from the Show table, current to now"""
+
+    swept, _ = locked_watermark(connection)
+
+    for model, owner in OWNERS:
+        connection.execute(
+            db.update(model).values(
+                upcoming_shows_count=owned_shows(model, owner, Show.start_time > now),
+                past_shows_count=owned_shows(model, owner, Show.start_time <= now),
+            )
+        )
+
+    set_watermark(connection, swept, now)
@@ -0,0 +1,108 @@
+import time
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from metrics import metrics
+
+# ----------------------------------------------------------------------------#
+# Engine options.
+# ----------------------------------------------------------------------------#
+
+# Pool size (None: one per WORKER_THREADS), overflow and checkout timeout in
+# seconds, per worker model. A sync worker's threads each hold at most one
+# connection, with a little overflow for streamed responses; gevent and async
+# workers multiplex many requests over a bounded pool, and fail a checkout
+# fast rather than queue requests behind a saturated database.
+POOL_DEFAULTS = {
+    "sync": (None, 2, 30),
+    "gevent": (10, 10, 5),
+    "async": (10, 5, 5),
+}
+
+
+class TimedCheckouts:
+    """Pool mixin reporting how long each checkout waited for a connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.pool_waited(time.perf_counter() - start)
+
+
+class TimedQueuePool(TimedCheckouts, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(TimedCheckouts, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options(config, uri, worker_class=None):
+    """Engine options for the database at uri, under the configured worker model.
+
+    worker_class overrides WORKER_CLASS, e.g. "async" for an async driver's
+    engine serving the event loop.
+    """
+
+    url = make_url(uri)
+    is_async = url.get_dialect().is_async
+    options = {"pool_pre_ping": config["DB_POOL_PRE_PING"]}
+
+    # SQLite uses a single-connection or null pool, which takes no sizing
+    if url.get_backend_name() == "sqlite":
+        return options
+
+    worker_class = worker_class or config["WORKER_CLASS"]
+    if worker_class not in POOL_DEFAULTS:
+        raise ValueError(f"Unknown WORKER_CLASS: {worker_class}")
+    size, overflow, timeout = POOL_DEFAULTS[worker_class]
+
+    options.update(
+        poolclass=TimedAsyncQueuePool if is_async else TimedQueuePool,
+        pool_size=config["DB_POOL_SIZE"] or size or config["WORKER_THREADS"],
+        max_overflow=(
+            overflow if config["DB_MAX_OVERFLOW"] is None else config["DB_MAX_OVERFLOW"]
+        ),
+        pool_timeout=config["DB_POOL_TIMEOUT"] or timeout,
+        pool_recycle=config["DB_POOL_RECYCLE"],
+    )
+
+    timeout = config["DB_STATEMENT_TIMEOUT"]
+    if url.get_backend_name() == "postgresql" and timeout:
+        if url.get_driver_name() == "asyncpg":
+            options["connect_args"] = {
+                "server_settings": {"statement_timeout": str(timeout)}
+            }
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={timeout}"}
+    return options
+
+
+# ----------------------------------------------------------------------------#
+# Pool stats.
+# ----------------------------------------------------------------------------#
+
+
+def pool_stats(engine):
+    """Connections in use, idle and in overflow in this worker's pool"""
+
+    pool = engine.pool
+    stats = {"pool": type(pool).__name__, "status": pool.status()}
+    if not hasattr(pool, "checkedout"):
+        return stats
+
+    # A max_overflow of -1 leaves the pool unbounded, so it has no utilisation
+    max_overflow = pool._max_overflow
+    capacity = pool.size() + max_overflow if max_overflow >= 0 else None
+    stats.update(
+        size=pool.size(),
+        max_overflow=max_overflow,
+        checked_out=pool.checkedout(),
+        checked_in=pool.checkedin(),
+        overflow=max(pool.overflow(), 0),
+        utilisation=round(pool.checkedout() / capacity, 3) if capacity else None,
+    )
+    return stats
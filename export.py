@@ -0,0 +1,85 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from records import VENUE_FIELDS, ARTIST_FIELDS
+from models import db, Venue, Artist, Show
+
+# ----------------------------------------------------------------------------#
+# Export.
+# ----------------------------------------------------------------------------#
+
+# Rows fetched per round trip; on Postgres the query runs on a server-side
+# cursor, so memory stays flat however many rows are exported
+EXPORT_BATCH_SIZE = 1000
+
+
+def export_query(kind):
+    """Select for an export, with columns named as `flask fyyur import` reads them"""
+
+    if kind == "venues":
+        return db.select(*[getattr(Venue, c) for c in VENUE_FIELDS]).order_by(Venue.id)
+    if kind == "artists":
+        return db.select(*[getattr(Artist, c) for c in ARTIST_FIELDS]).order_by(
+            Artist.id
+        )
+    return (
+        db.select(
+            Show.artist_id,
+            Show.venue_id,
+            Show.start_time,
+            Artist.name.label("artist_name"),
+            Venue.name.label("venue_name"),
+        )
+        .join(Artist, Artist.id == Show.artist_id)
+        .join(Venue, Venue.id == Show.venue_id)
+        .order_by(Show.start_time, Show.artist_id, Show.venue_id)
+    )
+
+
+def export_rows(kind):
+    """Yields one dict per exported row, datetimes as ISO 8601 strings"""
+
+    query = export_query(kind).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    result = db.session.execute(query)
+
+    for row in result:
+        yield {
+            key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in row._mapping.items()
+        }
+
+
+def ndjson_lines(kind):
+    lines = []
+
+    for row in export_rows(kind):
+        lines.append(json.dumps(row) + "\n")
+        if len(lines) >= EXPORT_BATCH_SIZE:
+            yield "".join(lines)
+            lines = []
+
+    yield "".join(lines)
+
+
+def csv_lines(kind):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, export_query(kind).selected_columns.keys())
+    writer.writeheader()
+
+    for row in export_rows(kind):
+        writer.writerow(row)
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+EXPORT_FORMATS = {
+    "ndjson": (ndjson_lines, "application/x-ndjson"),
+    "csv": (csv_lines, "text/csv"),
+}
+EXPORT_KINDS = ("venues", "artists", "shows")
@@ -1,5 +1,7 @@
 from datetime import datetime
+
 from flask_wtf import Form
+from records import my_strip_filter
 from wtforms import (
     IntegerField,
     StringField,
@@ -31,12 +33,6 @@ class FyyurBaseForm(Form):
             return unbound_field.bind(form=form, filters=filters, **options)
 
 
-def my_strip_filter(value):
-    if value is not None and hasattr(value, "strip"):
-        return value.strip()
-    return value
-
-
 def show_date_check():
     message = "Please enter a present or future show date"
 
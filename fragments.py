@@ -0,0 +1,94 @@
+import os
+import threading
+from collections import OrderedDict
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+from cache import private_directory
+
+# ----------------------------------------------------------------------------#
+# Template caches.
+# ----------------------------------------------------------------------------#
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache key, ... %} ... {% endcache %} renders its body once per key.
+
+    The key should hold the versions of whatever the body shows (e.g. the
+    updated_at of a show's artist), so an edit makes a new key rather than
+    having to invalidate the old one.
+    """
+
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [nodes.Const(parser.name), parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(["name:endcache"], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_render", [nodes.Tuple(key, "load")]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render(self, key, caller):
+        return fragments.get(key, caller)
+
+
+class Fragments:
+    """Template fragments rendered from an LRU cache, and compiled templates
+    from a bytecode cache.
+
+    Rendered fragments are kept per process, up to FRAGMENT_CACHE_SIZE of the
+    most recently used. Compiled templates are kept in JINJA_BYTECODE_CACHE_PATH
+    (by default in the instance folder), shared by the workers on a host, so a
+    fresh worker loads rather than compiles them. Jinja runs the bytecode it
+    finds there, so the directory must be private to the workers' user.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def init_app(self, app):
+        self.max_entries = app.config["FRAGMENT_CACHE_SIZE"]
+        self.entries = OrderedDict()
+        self.hits = self.misses = 0
+
+        if app.config["JINJA_BYTECODE_CACHE"]:
+            path = app.config["JINJA_BYTECODE_CACHE_PATH"] or os.path.join(
+                app.instance_path, "jinja"
+            )
+            app.jinja_env.bytecode_cache = FileSystemBytecodeCache(
+                private_directory(path)
+            )
+        app.jinja_env.add_extension(FragmentCacheExtension)
+
+    def get(self, key, render):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+
+        # Rendered outside the lock; two threads may both render a new key
+        value = render()
+        with self.lock:
+            self.misses += 1
+            if self.max_entries:
+                self.entries[key] = value
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return value
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+fragments = Fragments()
@@ -0,0 +1,150 @@
+from datetime import datetime, time, timedelta
+from itertools import accumulate
+
+from forms import VenueForm
+
+# ----------------------------------------------------------------------------#
+# Synthetic catalogue.
+# ----------------------------------------------------------------------------#
+
+# Everything is drawn from one random.Random(seed), and show dates are offsets
+# from an anchor day, so a seed and anchor always give the same catalogue.
+
+GENRES = [name for name, _ in VenueForm.genres.kwargs["choices"]]
+
+# (city, state) pairs; earlier ones host more venues and artists
+CITIES = [
+    ("New York", "NY"),
+    ("Los Angeles", "CA"),
+    ("Chicago", "IL"),
+    ("Nashville", "TN"),
+    ("Austin", "TX"),
+    ("San Francisco", "CA"),
+    ("Seattle", "WA"),
+    ("New Orleans", "LA"),
+    ("Atlanta", "GA"),
+    ("Boston", "MA"),
+    ("Denver", "CO"),
+    ("Portland", "OR"),
+    ("Philadelphia", "PA"),
+    ("Detroit", "MI"),
+    ("Minneapolis", "MN"),
+    ("Miami", "FL"),
+    ("Memphis", "TN"),
+    ("Kansas City", "MO"),
+    ("Salt Lake City", "UT"),
+    ("Burlington", "VT"),
+]
+
+VENUE_WORDS = (
+    "Blue Note Velvet Copper Golden Echo Lantern Harbor Union Orchid Iron "
+    "Silver Crescent Red Rooster Lucky Electric Midnight Paper Moon Crown"
+).split()
+VENUE_KINDS = "Hall Lounge Room Club Theatre Tavern Ballroom House Garden Stage".split()
+STREETS = "Main Oak Pine Maple Cedar Elm Market Mission Bedford Fulton Sunset".split()
+FIRST_NAMES = (
+    "Ada Ben Cleo Dev Eli Faye Gus Hana Ivan Jade Kai Lena Milo Nia Otis Pia "
+    "Quinn Rosa Sam Tess Uma Vic Wes Xena Yuri Zoe"
+).split()
+LAST_NAMES = (
+    "Adams Baker Cruz Diaz Evans Flores Grant Hayes Ito Jones Kim Lopez Moore "
+    "Nash Ortiz Park Reyes Silva Tran Vega Wells Young"
+).split()
+BAND_WORDS = (
+    "Wild Sax Petals Static Rivers Ghost Neon Velvet Howling Paper Tigers "
+    "Kings Sparrows Machines Satellites Wolves Orchestra Collective Trio"
+).split()
+
+# Shows start on the half hour between 18:00 and 23:30
+SHOW_SLOTS = [time(18 + n // 2, 30 * (n % 2)) for n in range(12)]
+
+
+def zipf_weights(count, skew=1.1):
+    """Cumulative weights picking rank n with probability ~ 1 / n ** skew"""
+
+    return list(accumulate(1 / (rank**skew) for rank in range(1, count + 1)))
+
+
+def phone(rng):
+    return f"{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(0, 9999):04d}"
+
+
+def pick_genres(rng):
+    return rng.sample(GENRES, rng.choice((1, 1, 2, 2, 3)))
+
+
+def generate_venues(rng, count, first_id):
+    cities = zipf_weights(len(CITIES))
+    for id in range(first_id, first_id + count):
+        city, state = rng.choices(CITIES, cum_weights=cities)[0]
+        name = f"The {rng.choice(VENUE_WORDS)} {rng.choice(VENUE_KINDS)}"
+        yield {
+            "id": id,
+            "name": f"{name} {id}",
+            "city": city,
+            "state": state,
+            "address": f"{rng.randint(1, 9999)} {rng.choice(STREETS)} St",
+            "phone": phone(rng),
+            "genres": pick_genres(rng),
+            "image_link": f"https://picsum.photos/seed/venue{id}/600/400",
+            "website": f"https://venue{id}.example.com",
+            "seeking_talent": rng.random() < 0.3,
+            "seeking_description": "",
+        }
+
+
+def generate_artists(rng, count, first_id):
+    cities = zipf_weights(len(CITIES))
+    for id in range(first_id, first_id + count):
+        city, state = rng.choices(CITIES, cum_weights=cities)[0]
+        if rng.random() < 0.5:
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        else:
+            name = f"The {rng.choice(BAND_WORDS)} {rng.choice(BAND_WORDS)}"
+        yield {
+            "id": id,
+            "name": f"{name} {id}",
+            "city": city,
+            "state": state,
+            "phone": phone(rng),
+            "genres": pick_genres(rng),
+            "image_link": f"https://picsum.photos/seed/artist{id}/600/600",
+            "website": f"https://artist{id}.example.com",
+            "seeking_venue": rng.random() < 0.3,
+            "seeking_description": "",
+        }
+
+
+def generate_shows(
+    rng,
+    count,
+    venue_ids,
+    artist_ids,
+    anchor,
+    upcoming_share=0.1,
+    history_days=3 * 365,
+    horizon_days=180,
+):
+    """Shows between the ids given, most of them in the past.
+
+    A few venues and artists get most of the shows (Zipf-distributed).
+    upcoming_share of the shows fall in the horizon_days after anchor, the
+    rest in the history_days before it.
+    """
+
+    venues = zipf_weights(len(venue_ids))
+    artists = zipf_weights(len(artist_ids))
+    anchor = datetime.combine(anchor, time())
+
+    for _ in range(count):
+        if rng.random() < upcoming_share:
+            day = rng.randrange(horizon_days)
+        else:
+            day = -1 - rng.randrange(history_days)
+        yield {
+            "venue_id": rng.choices(venue_ids, cum_weights=venues)[0],
+            "artist_id": rng.choices(artist_ids, cum_weights=artists)[0],
+            "start_time": datetime.combine(
+                (anchor + timedelta(days=day)).date(), rng.choice(SHOW_SLOTS)
+            ),
+        }
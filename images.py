@@ -0,0 +1,408 @@
+import hashlib
+import http.client
+import io
+import ipaddress
+import json
+import os
+import socket
+import ssl
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+from importlib.util import find_spec
+
+from flask import Blueprint, abort, current_app, redirect, request, send_file, url_for
+from itsdangerous import BadSignature, URLSafeSerializer
+from werkzeug.security import safe_join
+from werkzeug.utils import import_string
+
+from cache import private_directory
+
+# ----------------------------------------------------------------------------#
+# Fetchers.
+# ----------------------------------------------------------------------------#
+
+# A fetcher takes an image_link and returns its bytes, raising on failure.
+# IMAGE_FETCHER names another (a callable or its import path), e.g. one
+# reading local files in place of the network in tests.
+
+# image_links are whatever was typed into a form or imported, so the default
+# fetcher only connects to public addresses: each hop's host is resolved,
+# refused if any of its addresses is loopback, private, link-local (e.g. a
+# cloud metadata service) or otherwise not global, and connected to at the
+# address that was checked, so a second lookup can't point elsewhere.
+
+
+def public_address(host, port):
+    """An address of host to connect to; raises ValueError unless all are global"""
+
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise ValueError(f"Can't resolve {host}: {e}") from e
+
+    addresses = [ipaddress.ip_address(info[4][0].split("%", 1)[0]) for info in infos]
+    for address in addresses:
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise ValueError(f"{host} resolves to a non-public address {address}")
+    return str(addresses[0])
+
+
+class PinnedHTTPConnection(http.client.HTTPConnection):
+    """Connects to a given address, sending the URL's host as Host"""
+
+    def __init__(self, host, address, **kwargs):
+        super().__init__(host, **kwargs)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address, self.port), self.timeout)
+
+
+class PinnedHTTPSConnection(http.client.HTTPSConnection):
+    """Connects to a given address, verifying the certificate of the URL's host"""
+
+    def __init__(self, host, address, **kwargs):
+        super().__init__(host, context=ssl.create_default_context(), **kwargs)
+        self.address = address
+
+    def connect(self):
+        sock = socket.create_connection((self.address, self.port), self.timeout)
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+def fetch_url(url, timeout=5, max_bytes=10 * 2**20, max_redirects=3):
+    """Downloads an http(s) image from a public address, up to max_bytes"""
+
+    for _ in range(max_redirects + 1):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"Not an http(s) URL: {url}")
+
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        address = public_address(parts.hostname, port)
+        connection_class = (
+            PinnedHTTPSConnection if parts.scheme == "https" else PinnedHTTPConnection
+        )
+        connection = connection_class(
+            parts.hostname, address, port=port, timeout=timeout
+        )
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        try:
+            connection.request("GET", path, headers={"User-Agent": "Fyyur thumbnails"})
+            response = connection.getresponse()
+            if response.status in (301, 302, 303, 307, 308):
+                location = response.getheader("Location")
+                if not location:
+                    raise ValueError(f"Redirect without a Location: {url}")
+                url = urllib.parse.urljoin(url, location)
+                continue
+            if response.status != 200:
+                raise ValueError(f"HTTP {response.status}: {url}")
+            data = response.read(max_bytes + 1)
+        finally:
+            connection.close()
+
+        if len(data) > max_bytes:
+            raise ValueError(f"Image over {max_bytes} bytes: {url}")
+        return data
+
+    raise ValueError(f"Over {max_redirects} redirects: {url}")
+
+
+# ----------------------------------------------------------------------------#
+# Thumbnails.
+# ----------------------------------------------------------------------------#
+
+FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+
+
+def render_thumbnails(data, sizes, quality):
+    """{(size, format): bytes} of every size of an image, as WebP and as JPEG
+    (or PNG, for images with transparency)"""
+
+    from PIL import Image
+
+    source = Image.open(io.BytesIO(data))
+    # Lets JPEG decode at a fraction of full size when that's all it takes
+    source.draft("RGB", tuple(map(max, zip(*sizes.values()))))
+    source.load()
+
+    transparent = source.mode in ("RGBA", "LA", "P") and (
+        "transparency" in source.info or source.mode != "P"
+    )
+    fallback = "png" if transparent else "jpeg"
+    source = source.convert("RGBA" if transparent else "RGB")
+
+    thumbnails = {}
+    for size, box in sizes.items():
+        image = source.copy()
+        image.thumbnail(box, Image.LANCZOS)
+        for format in ("webp", fallback):
+            output = io.BytesIO()
+            image.save(output, format.upper(), quality=quality, optimize=True)
+            thumbnails[size, format] = output.getvalue()
+    return thumbnails
+
+
+class Thumbnails:
+    """Thumbnails of the venue and artist image_links, in a disk cache.
+
+    image_url(link, size) in templates gives the /images URL of a link at one
+    of THUMBNAIL_SIZES, the link itself signed into it so only image_links
+    are proxied. The first request for a link fetches it, once, and renders
+    all its sizes; each is stored under the hash of its content (so records
+    sharing an image share the files) with a ref from the link to them.
+    Files least recently served are evicted once the cache grows past
+    THUMBNAIL_CACHE_BYTES; each worker adds its own writes to the size it
+    last read from the disk, which it re-reads every RESCAN_SECONDS so the
+    others' writes count too. Links that fail to fetch or decode are sent to
+    the original for FAILURE_SECONDS, before being tried again.
+
+    Links are signed with SECRET_KEY, which create_app() requires in
+    production: a per-process key would make every worker reject the
+    others' URLs.
+    """
+
+    FAILURE_SECONDS = 300
+    # Serving a file marks it used at most this often, in its mtime
+    TOUCH_SECONDS = 60
+    # The other workers' writes are counted towards the cap at most this late
+    RESCAN_SECONDS = 30
+
+    def __init__(self):
+        self.failures = {}
+        self.touched = {}
+        self.size = None
+        self.scanned_at = 0
+        self.lock = threading.Lock()
+        # Guards link_locks and failures
+        self.links_lock = threading.Lock()
+        # link: [lock, requests holding or waiting for it]
+        self.link_locks = {}
+
+    def init_app(self, app):
+        # Thumbnails are rendered with Pillow; without it pages link the originals
+        self.enabled = app.config["IMAGE_PROXY"] and bool(find_spec("PIL"))
+        self.path = private_directory(
+            app.config["THUMBNAIL_PATH"]
+            or os.path.join(app.instance_path, "thumbnails")
+        )
+        self.sizes = app.config["THUMBNAIL_SIZES"]
+        self.quality = app.config["THUMBNAIL_QUALITY"]
+        self.max_bytes = app.config["THUMBNAIL_CACHE_BYTES"]
+        self.max_age = app.config["THUMBNAIL_MAX_AGE"]
+
+        fetcher = app.config["IMAGE_FETCHER"] or fetch_url
+        self.fetch = import_string(fetcher) if isinstance(fetcher, str) else fetcher
+        self.signer = URLSafeSerializer(app.secret_key, salt="thumbnails")
+        self.failures, self.touched, self.size, self.scanned_at = {}, {}, None, 0
+
+        app.jinja_env.globals["image_url"] = self.image_url
+
+    def image_url(self, link, size):
+        if not link or not self.enabled:
+            return link
+        return url_for("images.thumbnail", size=size, token=self.signer.dumps(link))
+
+    # Disk layout: refs/<link hash>.json maps "<size>.<format>" to a file in
+    # blobs/ named by the hash of its content
+
+    def ref_path(self, link):
+        digest = hashlib.sha256(link.encode()).hexdigest()
+        return os.path.join(self.path, "refs", digest[:2], digest + ".json")
+
+    def blob_path(self, data, format):
+        digest = hashlib.sha256(data).hexdigest()
+        return os.path.join(self.path, "blobs", digest[:2], f"{digest}.{format}")
+
+    def write(self, path, data):
+        """Writes a file whole (renamed into place) for other workers to read"""
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp, "wb") as f:
+            f.write(data)
+        os.replace(temp, path)
+
+    def lookup(self, link, size, webp):
+        """Path of a cached thumbnail, or None"""
+
+        try:
+            with open(self.ref_path(link), encoding="utf-8") as f:
+                ref = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        for format in ("webp", "jpeg", "png") if webp else ("jpeg", "png"):
+            if f"{size}.{format}" in ref:
+                # A ref only ever names a file under blobs/
+                path = safe_join(self.path, ref[f"{size}.{format}"])
+                return path if path and os.path.isfile(path) else None
+        return None
+
+    def store(self, link):
+        """Fetches link and caches every size of it; False if that failed"""
+
+        with self.links_lock:
+            failed_at = self.failures.get(link)
+        if failed_at and time.time() - failed_at < self.FAILURE_SECONDS:
+            return False
+
+        try:
+            thumbnails = render_thumbnails(self.fetch(link), self.sizes, self.quality)
+        except Exception:
+            current_app.logger.warning("Can't thumbnail %s", link, exc_info=True)
+            self.failed(link)
+            return False
+
+        ref = {}
+        for (size, format), data in thumbnails.items():
+            path = self.blob_path(data, format)
+            if not os.path.exists(path):
+                self.write(path, data)
+                self.grow(len(data))
+            ref[f"{size}.{format}"] = os.path.relpath(path, self.path)
+        self.write(self.ref_path(link), json.dumps(ref).encode())
+        with self.links_lock:
+            self.failures.pop(link, None)
+        return True
+
+    def failed(self, link):
+        """Records a failed link, forgetting those past FAILURE_SECONDS.
+
+        failures is kept in the order links failed, so the expired ones are
+        the oldest, at its front.
+        """
+
+        now = time.time()
+        with self.links_lock:
+            self.failures.pop(link, None)
+            self.failures[link] = now
+            while True:
+                old, failed_at = next(iter(self.failures.items()))
+                if now - failed_at < self.FAILURE_SECONDS:
+                    break
+                del self.failures[old]
+
+    @contextmanager
+    def fetching(self, link):
+        """Holds link's lock, so concurrent requests for it wait for one fetch.
+
+        Each lock is counted by the requests holding or waiting for it, and
+        dropped by the last one out.
+        """
+
+        with self.links_lock:
+            entry = self.link_locks.setdefault(link, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self.links_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self.link_locks[link]
+
+    def get(self, link, size, webp):
+        """Path of a thumbnail, fetching its link if it isn't cached yet"""
+
+        path = self.lookup(link, size, webp)
+        if path is None:
+            with self.fetching(link):
+                path = self.lookup(link, size, webp)
+                if path is None and self.store(link):
+                    path = self.lookup(link, size, webp)
+        if path is not None:
+            self.touch(path)
+        return path
+
+    def touch(self, path):
+        now = time.time()
+        if now - self.touched.get(path, 0) > self.TOUCH_SECONDS:
+            self.touched[path] = now
+            try:
+                os.utime(path, (now, now))
+            except FileNotFoundError:
+                pass
+
+    def grow(self, written):
+        """Counts bytes written, evicting once the cache is over its cap"""
+
+        with self.lock:
+            if self.size is None or time.time() - self.scanned_at > self.RESCAN_SECONDS:
+                self.size = sum(size for _, size, _ in self.blobs())
+                self.scanned_at = time.time()
+            else:
+                self.size += written
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def blobs(self):
+        for root, _, files in os.walk(os.path.join(self.path, "blobs")):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, os.path.join(root, name)
+
+    def evict(self):
+        """Deletes the least recently served files, down to 80% of the cap.
+
+        Refs to them are left to be found dangling, which refetches the link.
+        """
+
+        blobs = sorted(self.blobs())
+        self.size = sum(size for _, size, _ in blobs)
+        self.scanned_at = time.time()
+        for _, size, path in blobs:
+            if self.size <= self.max_bytes * 0.8:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+            self.touched.pop(path, None)
+
+
+thumbnails = Thumbnails()
+
+# ----------------------------------------------------------------------------#
+# Image proxy.
+# ----------------------------------------------------------------------------#
+
+images = Blueprint("images", __name__, url_prefix="/images")
+
+
+@images.route("/<size>/<token>")
+def thumbnail(size, token):
+    if size not in thumbnails.sizes:
+        abort(404)
+    try:
+        link = thumbnails.signer.loads(token)
+    except BadSignature:
+        abort(404)
+
+    # WebP only for clients that name it: werkzeug matches image/* and */* too,
+    # which browsers without WebP (e.g. Safari 13) send
+    webp = "image/webp" in request.accept_mimetypes.values()
+    path = thumbnails.get(link, size, webp=webp)
+    if path is None:
+        return redirect(link)
+
+    format = path.rsplit(".", 1)[1]
+    response = send_file(path, mimetype=FORMATS[format], max_age=thumbnails.max_age)
+    response.vary.add("Accept")
+    response.cache_control.public = True
+    return response
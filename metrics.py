@@ -0,0 +1,470 @@
+import hmac
+import json
+import os
+import re
+import resource
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from functools import wraps
+
+from flask import (
+    Response,
+    abort,
+    before_render_template,
+    current_app,
+    g,
+    request,
+    template_rendered,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# ----------------------------------------------------------------------------#
+# Metric types.
+# ----------------------------------------------------------------------------#
+
+# Metrics are kept per worker process and carry a "worker" label (its pid),
+# so series from workers behind the same /metrics URL stay apart and can be
+# summed. With METRICS_PATH set, workers also write their series there, and
+# /metrics reports every live worker's, whichever worker serves the scrape.
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def label_text(names, values):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}"
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = ("worker",) + tuple(labels)
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        key = (str(os.getpid()),) + tuple(escape_label(label) for label in labels)
+        with self.lock:
+            counts, total = self.series.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self.series[key] = (counts, total + value)
+
+    def snapshot(self):
+        """This worker's series, as [(labels, bucket counts, sum)]"""
+
+        with self.lock:
+            return [
+                (key, list(counts), total)
+                for key, (counts, total) in self.series.items()
+            ]
+
+    def lines(self, series):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+
+        for key, counts, total in sorted(series):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                labels = label_text(self.labels + ("le",), key + (bound,))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = label_text(self.labels, key)
+            yield f"{self.name}_sum{labels} {total}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Gauge:
+    """Gauge read when /metrics is scraped, from read() -> {labels: value}"""
+
+    def __init__(self, name, help, labels, read):
+        self.name = name
+        self.help = help
+        self.labels = ("worker",) + tuple(labels)
+        self.read = read
+
+    def snapshot(self):
+        """This worker's current values, as [(labels, value)]"""
+
+        pid = str(os.getpid())
+        return [((pid,) + key, value) for key, value in self.read().items()]
+
+    def lines(self, series):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        for key, value in sorted(series):
+            yield f"{self.name}{label_text(self.labels, key)} {value}"
+
+
+def internal(view):
+    """Restricts a view to clients sending METRICS_TOKEN as a bearer token.
+
+    Without a token configured the view is open in development and a 404 in
+    production.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = current_app.config["METRICS_TOKEN"]
+        if not token:
+            if current_app.config["PRODUCTION"]:
+                abort(404)
+        else:
+            scheme, _, sent = request.headers.get("Authorization", "").partition(" ")
+            if scheme.lower() != "bearer" or not hmac.compare_digest(
+                sent.encode(), token.encode()
+            ):
+                return Response(
+                    "Unauthorized\n",
+                    401,
+                    {"WWW-Authenticate": "Bearer"},
+                    mimetype="text/plain",
+                )
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+# ----------------------------------------------------------------------------#
+# Query budgets.
+# ----------------------------------------------------------------------------#
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(queries):
+    """Declares the most SQL statements a view may run per request"""
+
+    def decorator(view):
+        view.query_budget = queries
+        return view
+
+    return decorator
+
+
+# Literals and expanded IN lists vary between runs of the same query
+SHAPE_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+SHAPE_LISTS = re.compile(
+    r"\((?:\s*\?\s*,)+\s*\?\s*\)|\((?:\s*%\(\w+\)s\s*,)+\s*%\(\w+\)s\s*\)"
+)
+
+
+def statement_shape(statement):
+    shape = SHAPE_LITERALS.sub("?", statement)
+    return " ".join(SHAPE_LISTS.sub("(?)", shape).split())
+
+
+def budget_violations(budget, statements, repeat_limit):
+    """Problems with a request's statements: over budget, or an N+1 pattern"""
+
+    problems = []
+    if budget is not None and len(statements) > budget:
+        problems.append(
+            f"ran {len(statements)} statements, budget {budget}:\n  "
+            + "\n  ".join(statements)
+        )
+
+    for shape, count in Counter(map(statement_shape, statements)).items():
+        if count > repeat_limit:
+            problems.append(f"ran the same statement {count} times (N+1?):\n  {shape}")
+    return problems
+
+
+# ----------------------------------------------------------------------------#
+# Instrumentation.
+# ----------------------------------------------------------------------------#
+
+
+class Metrics:
+    """Times requests, their SQL and templates, and the pool checkouts.
+
+    Each request counts its statements, DB time and slowest statement,
+    which go to per-endpoint histograms and, with SERVER_TIMING, to the
+    response's Server-Timing header. Requests slower than
+    SLOW_REQUEST_SECONDS log their slowest statement. Streamed responses are
+    timed to their first byte.
+
+    With QUERY_BUDGETS set to "log" or "raise", a request that runs more
+    statements than its view's @query_budget, or one statement more than
+    QUERY_REPEAT_LIMIT times, is logged or fails with QueryBudgetExceeded.
+
+    With METRICS_PATH set, each worker writes a snapshot of its series to
+    <pid>.json there after a request, at most every METRICS_FLUSH_SECONDS,
+    and the exposition merges in the other live workers' snapshots.
+    """
+
+    def __init__(self):
+        self.request_seconds = Histogram(
+            "fyyur_request_duration_seconds",
+            "Request latency per endpoint",
+            ("endpoint",),
+        )
+        self.request_queries = Histogram(
+            "fyyur_request_queries",
+            "SQL statements run per request",
+            ("endpoint",),
+            QUERY_BUCKETS,
+        )
+        self.request_db_seconds = Histogram(
+            "fyyur_request_db_seconds",
+            "Time spent running SQL per request",
+            ("endpoint",),
+        )
+        self.slowest_statement_seconds = Histogram(
+            "fyyur_request_slowest_statement_seconds",
+            "Slowest SQL statement per request",
+            ("endpoint",),
+        )
+        self.pool_wait_seconds = Histogram(
+            "fyyur_db_pool_wait_seconds",
+            "Time spent waiting for a pooled connection",
+        )
+        self.template_seconds = Histogram(
+            "fyyur_template_render_seconds",
+            "Template render time",
+            ("template",),
+        )
+        self.gauges = []
+        self.path = None
+        self.flushed_at = 0
+
+    def init_app(self, app, db):
+        self.path = app.config["METRICS_PATH"]
+        if self.path:
+            os.makedirs(self.path, mode=0o700, exist_ok=True)
+        self.flush_seconds = app.config["METRICS_FLUSH_SECONDS"]
+        self.server_timing = app.config["SERVER_TIMING"]
+        self.budget_mode = app.config["QUERY_BUDGETS"]
+        self.repeat_limit = app.config["QUERY_REPEAT_LIMIT"]
+        self.slow_request_seconds = app.config["SLOW_REQUEST_SECONDS"]
+        self.logger = app.logger
+
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        before_render_template.connect(self.start_template, app)
+        template_rendered.connect(self.finish_template, app)
+
+        def read_pool():
+            return {
+                (key or "default",): engine.pool.checkedout()
+                for key, engine in db.engines.items()
+                if hasattr(engine.pool, "checkedout")
+            }
+
+        def read_rss():
+            # ru_maxrss is in kilobytes on Linux
+            return {(): resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+
+        self.gauges = [
+            Gauge(
+                "fyyur_db_pool_checked_out",
+                "Connections checked out of the pool",
+                ("bind",),
+                read_pool,
+            ),
+            Gauge(
+                "fyyur_process_max_rss_bytes",
+                "Peak resident memory of the worker process",
+                (),
+                read_rss,
+            ),
+        ]
+
+    def start_request(self):
+        g.metrics = {
+            "start": time.perf_counter(),
+            "queries": 0,
+            "db_seconds": 0.0,
+            "slowest": (0.0, None),
+            "pool_wait": 0.0,
+            "templates": 0.0,
+            "statements": [],
+        }
+
+    def finish_request(self, response):
+        stats = g.pop("metrics", None)
+        if stats is None:
+            return response
+
+        elapsed = time.perf_counter() - stats["start"]
+        endpoint = request.endpoint or "none"
+        slowest, statement = stats["slowest"]
+
+        self.request_seconds.observe(elapsed, endpoint)
+        self.request_queries.observe(stats["queries"], endpoint)
+        self.request_db_seconds.observe(stats["db_seconds"], endpoint)
+        self.slowest_statement_seconds.observe(slowest, endpoint)
+
+        if elapsed > self.slow_request_seconds:
+            self.logger.warning(
+                "slow request %s %s: %.3fs, %d queries in %.3fs, slowest %.3fs: %s",
+                request.method,
+                request.full_path,
+                elapsed,
+                stats["queries"],
+                stats["db_seconds"],
+                slowest,
+                statement,
+            )
+
+        if self.budget_mode != "off":
+            self.check_budget(endpoint, stats["statements"])
+
+        if self.server_timing:
+            response.headers["Server-Timing"] = ", ".join(
+                [
+                    f'db;dur={stats["db_seconds"] * 1000:.1f};desc="{stats["queries"]} queries"',
+                    f"db-slowest;dur={slowest * 1000:.1f}",
+                    f'pool;dur={stats["pool_wait"] * 1000:.1f}',
+                    f'tpl;dur={stats["templates"] * 1000:.1f}',
+                    f"app;dur={elapsed * 1000:.1f}",
+                ]
+            )
+
+        if self.path and time.monotonic() - self.flushed_at > self.flush_seconds:
+            self.flush()
+        return response
+
+    def check_budget(self, endpoint, statements):
+        view = current_app.view_functions.get(endpoint)
+        budget = getattr(view, "query_budget", None)
+        problems = budget_violations(budget, statements, self.repeat_limit)
+        if not problems:
+            return
+
+        message = f"{request.method} {request.full_path.rstrip('?')} " + "\n".join(
+            problems
+        )
+        if self.budget_mode == "raise":
+            raise QueryBudgetExceeded(message)
+        self.logger.warning("query budget: %s", message)
+
+    def statement_finished(self, seconds, statement):
+        stats = g.get("metrics")
+        if stats is None:
+            return
+        if self.budget_mode != "off":
+            stats["statements"].append(statement)
+        stats["queries"] += 1
+        stats["db_seconds"] += seconds
+        if seconds > stats["slowest"][0]:
+            stats["slowest"] = (seconds, statement)
+
+    def pool_waited(self, seconds):
+        self.pool_wait_seconds.observe(seconds)
+        stats = g.get("metrics") if g else None
+        if stats is not None:
+            stats["pool_wait"] += seconds
+
+    def start_template(self, app, template, context):
+        g.setdefault("template_starts", {})[template.name] = time.perf_counter()
+
+    def finish_template(self, app, template, context):
+        start = g.get("template_starts", {}).pop(template.name, None)
+        if start is None:
+            return
+        seconds = time.perf_counter() - start
+        self.template_seconds.observe(seconds, template.name)
+        stats = g.get("metrics")
+        if stats is not None:
+            stats["templates"] += seconds
+
+    def all(self):
+        return [
+            self.request_seconds,
+            self.request_queries,
+            self.request_db_seconds,
+            self.slowest_statement_seconds,
+            self.pool_wait_seconds,
+            self.template_seconds,
+            *self.gauges,
+        ]
+
+    def snapshot(self):
+        return {metric.name: metric.snapshot() for metric in self.all()}
+
+    def flush(self):
+        """Writes this worker's series to METRICS_PATH for the other workers"""
+
+        self.flushed_at = time.monotonic()
+        path = os.path.join(self.path, f"{os.getpid()}.json")
+        with open(f"{path}.tmp", "w") as file:
+            json.dump(self.snapshot(), file)
+        os.replace(f"{path}.tmp", path)
+
+    def worker_snapshots(self):
+        """The last snapshots of the other workers in METRICS_PATH.
+
+        Files left by workers that have exited are removed, so their series
+        drop out (and restart from zero under a new worker's pid).
+        """
+
+        for name in os.listdir(self.path):
+            pid, extension = os.path.splitext(name)
+            if extension != ".json" or not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                os.remove(os.path.join(self.path, name))
+                continue
+            except PermissionError:
+                pass
+
+            try:
+                with open(os.path.join(self.path, name)) as file:
+                    yield json.load(file)
+            except (OSError, ValueError):
+                continue
+
+    def exposition(self):
+        series = self.snapshot()
+        if self.path:
+            for snapshot in self.worker_snapshots():
+                for name, rows in snapshot.items():
+                    series.setdefault(name, []).extend(
+                        (tuple(row[0]),) + tuple(row[1:]) for row in rows
+                    )
+
+        lines = (
+            line for metric in self.all() for line in metric.lines(series[metric.name])
+        )
+        return "\n".join(lines) + "\n"
+
+    def response(self):
+        return Response(self.exposition(), mimetype="text/plain; version=0.0.4")
+
+
+metrics = Metrics()
+
+
+# Every engine (the primary and each replica) reports its statements to the
+# current request, if any
+@event.listens_for(Engine, "before_cursor_execute")
+def statement_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("statement_starts", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def statement_ended(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info["statement_starts"].pop()
+    if g:
+        metrics.statement_finished(time.perf_counter() - start, statement)
+
+
+@event.listens_for(Engine, "handle_error")
+def statement_failed(context):
+    if context.connection is not None:
+        starts = context.connection.info.get("statement_starts")
+        if starts:
+            starts.pop()
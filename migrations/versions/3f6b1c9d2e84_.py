@@ -0,0 +1,59 @@
+"""add updated_at markers
+
+Revision ID: 3f6b1c9d2e84
+Revises: e7a90c3d15f8
+Create Date: 2026-10-18 13:02:41.317920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6b1c9d2e84'
+down_revision = 'e7a90c3d15f8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Added nullable, backfilled, then made NOT NULL with its default: SQLite
+    # can't add a NOT NULL column with a non-constant default, so the last step
+    # goes through batch mode, which recreates the table there. Markers are
+    # naive UTC like datetime.utcnow(): Postgres now() is in the session time
+    # zone, SQLite's CURRENT_TIMESTAMP is UTC already
+    if op.get_bind().dialect.name == 'postgresql':
+        utcnow = sa.text("timezone('utc', now())")
+    else:
+        utcnow = sa.text('CURRENT_TIMESTAMP')
+
+    for table, index in (
+        ('Venue', 'ix_Venue_updated_at'),
+        ('Artist', 'ix_Artist_updated_at'),
+        ('Show', 'ix_Show_updated_at'),
+    ):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.execute(
+            sa.table(table, sa.column('updated_at'))
+            .update()
+            .values(updated_at=utcnow)
+        )
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(
+                'updated_at',
+                existing_type=sa.DateTime(),
+                nullable=False,
+                server_default=utcnow,
+            )
+        op.create_index(index, table, ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table, index in (
+        ('Show', 'ix_Show_updated_at'),
+        ('Artist', 'ix_Artist_updated_at'),
+        ('Venue', 'ix_Venue_updated_at'),
+    ):
+        op.drop_index(index, table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('updated_at')
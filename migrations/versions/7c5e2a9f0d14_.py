@@ -0,0 +1,36 @@
+"""rank name search nearest first with trigram GiST indexes
+
+Revision ID: 7c5e2a9f0d14
+Revises: 6d0e3b8a7f25
+Create Date: 2026-10-18 17:12:45.308417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c5e2a9f0d14'
+down_revision = '6d0e3b8a7f25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # GiST trigram indexes serve ILIKE like the GIN ones they replace, and
+    # also ORDER BY name <-> term, so search reads its top results in order
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    for table in ('Venue', 'Artist'):
+        op.drop_index(f'ix_{table}_name_trgm', table_name=table)
+        op.create_index(f'ix_{table}_name_trgm', table, ['name'], unique=False, postgresql_using='gist', postgresql_ops={'name': 'gist_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    for table in ('Artist', 'Venue'):
+        op.drop_index(f'ix_{table}_name_trgm', table_name=table)
+        op.create_index(f'ix_{table}_name_trgm', table, ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
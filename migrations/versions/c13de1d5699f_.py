@@ -5,9 +5,10 @@ Revises:
 Create Date: 2023-03-03 01:24:58.021385
 
 """
+from datetime import datetime
+
 from alembic import op
 import sqlalchemy as sa
-from models import *
 
 
 # revision identifiers, used by Alembic.
@@ -19,7 +20,7 @@ depends_on = None
 
 def upgrade():
     # ### commands auto generated by Alembic - please adjust! ###
-    op.create_table('Artist',
+    Artist = op.create_table('Artist',
     sa.Column('id', sa.Integer(), nullable=False),
     sa.Column('name', sa.String(), nullable=True),
     sa.Column('city', sa.String(length=120), nullable=True),
@@ -33,7 +34,7 @@ def upgrade():
     sa.Column('seeking_description', sa.String(length=300), nullable=True),
     sa.PrimaryKeyConstraint('id')
     )
-    op.create_table('Venue',
+    Venue = op.create_table('Venue',
     sa.Column('id', sa.Integer(), nullable=False),
     sa.Column('name', sa.String(), nullable=True),
     sa.Column('city', sa.String(length=120), nullable=True),
@@ -48,7 +49,7 @@ def upgrade():
     sa.Column('seeking_description', sa.String(length=300), nullable=True),
     sa.PrimaryKeyConstraint('id')
     )
-    op.create_table('Show',
+    Show = op.create_table('Show',
     sa.Column('artist_id', sa.Integer(), nullable=False),
     sa.Column('venue_id', sa.Integer(), nullable=False),
     sa.Column('start_time', sa.DateTime(), nullable=False),
@@ -57,7 +58,8 @@ def upgrade():
     sa.PrimaryKeyConstraint('artist_id', 'venue_id', 'start_time')
     )
     
-    # Seed data
+    # Seed data, inserted through the tables as created above rather than the
+    # current models, whose columns have moved on since this revision
     fyyur_data = [
         sa.insert(Venue).values(
             id= 1,
@@ -136,27 +138,27 @@ def upgrade():
         sa.insert(Show).values(
             artist_id=4,
             venue_id=1,
-            start_time="2019-05-21T21:30:00.000Z"
+            start_time=datetime(2019, 5, 21, 21, 30)
         ),
         sa.insert(Show).values(
             artist_id=5,
             venue_id=3,
-            start_time="2019-06-15T23:00:00.000Z"
+            start_time=datetime(2019, 6, 15, 23, 0)
         ),        
         sa.insert(Show).values(
             artist_id=6,
             venue_id=3,
-            start_time="2035-04-01T20:00:00.000Z"
+            start_time=datetime(2035, 4, 1, 20, 0)
         ),
         sa.insert(Show).values(
             artist_id=6,
             venue_id=3,
-            start_time="2035-04-08T20:00:00.000Z"
+            start_time=datetime(2035, 4, 8, 20, 0)
         ),
         sa.insert(Show).values(
             artist_id=6,
             venue_id=3,
-            start_time="2035-04-15T20:00:00.000Z"
+            start_time=datetime(2035, 4, 15, 20, 0)
         )        
         ]    
     
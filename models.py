@@ -1,16 +1,188 @@
 from flask import Flask, render_template, request, Response, flash, redirect, url_for
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.sql.functions import FunctionElement
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 # ----------------------------------------------------------------------------#
 # Models.
 # ----------------------------------------------------------------------------#
 
 
-class Venue(db.Model):
+class group_concat(FunctionElement):
+    """Comma-joined aggregate of a string column: string_agg on Postgres"""
+
+    type = db.String()
+    name = "group_concat"
+    inherit_cache = True
+
+
+@compiles(group_concat)
+def compile_group_concat(element, compiler, **kw):
+    return f"group_concat({compiler.process(element.clauses, **kw)})"
+
+
+@compiles(group_concat, "postgresql")
+def compile_string_agg(element, compiler, **kw):
+    return f"string_agg({compiler.process(element.clauses, **kw)}, ',')"
+
+
+class utcnow(FunctionElement):
+    """The current UTC time as a naive timestamp, matching datetime.utcnow().
+
+    Postgres now() is in the session time zone, so it goes through
+    timezone('utc', ...); SQLite's CURRENT_TIMESTAMP is already UTC.
+    """
+
+    type = db.DateTime()
+    name = "utcnow"
+    inherit_cache = True
+
+
+@compiles(utcnow)
+def compile_utcnow(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
+
+@compiles(utcnow, "postgresql")
+def compile_timezone_utc(element, compiler, **kw):
+    return "timezone('utc', now())"
+
+
+class Genre(db.Model):
+    __tablename__ = "Genre"
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+    @classmethod
+    def named(cls, names):
+        """Genres for names (matched case-insensitively), creating missing ones.
+
+        Genres created earlier in the session are reused, so records built
+        before a flush don't each create the same new genre.
+        """
+
+        created = db.session.info.setdefault("genres", {})
+        genres = {
+            genre.name.lower(): genre
+            for genre in cls.query.filter(
+                db.func.lower(cls.name).in_([name.lower() for name in names])
+            )
+        }
+
+        for name in names:
+            if name.lower() not in genres:
+                genres[name.lower()] = created.get(name.lower()) or cls(name=name)
+                created[name.lower()] = genres[name.lower()]
+        return [genres[name.lower()] for name in names]
+
+
+# Genre links, each with a (genre_id, owner) index for genre-filtered listings
+venue_genres = db.Table(
+    "Venue_genres",
+    db.Column(
+        "venue_id",
+        db.Integer,
+        db.ForeignKey("Venue.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    db.Column("genre_id", db.Integer, db.ForeignKey("Genre.id"), primary_key=True),
+    db.Index("ix_Venue_genres_genre_id", "genre_id", "venue_id"),
+)
+
+artist_genres = db.Table(
+    "Artist_genres",
+    db.Column(
+        "artist_id",
+        db.Integer,
+        db.ForeignKey("Artist.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    db.Column("genre_id", db.Integer, db.ForeignKey("Genre.id"), primary_key=True),
+    db.Index("ix_Artist_genres_genre_id", "genre_id", "artist_id"),
+)
+
+# Link column holding the owner's id, per owner table
+GENRE_OWNERS = {
+    "Venue": venue_genres.c.venue_id,
+    "Artist": artist_genres.c.artist_id,
+}
+
+
+def split_genres(genres):
+    """Genre names from a list or comma-separated string, without repeats"""
+
+    if isinstance(genres, str):
+        genres = genres.split(",")
+
+    names = {}
+    for genre in genres or []:
+        if genre and genre.strip():
+            names.setdefault(genre.strip().lower(), genre.strip())
+    return list(names.values())
+
+
+def genre_names(owner, id):
+    """Comma-joined genre names linked to id, as a correlated scalar subquery"""
+
+    return (
+        db.select(group_concat(Genre.name))
+        .join_from(owner.table, Genre)
+        .where(owner == id)
+        .scalar_subquery()
+        .label("genres")
+    )
+
+
+class GenresMixin:
+    """genres as a list of names, stored through the genre_list relationship.
+
+    Assigning a list (or a comma-separated string) links the named genres;
+    at class level genres is the comma-joined names, for selects and exports.
+    """
+
+    @hybrid_property
+    def genres(self):
+        return [genre.name for genre in self.genre_list]
+
+    @genres.setter
+    def genres(self, names):
+        names = split_genres(names)
+        if {name.lower() for name in names} != {genre.lower() for genre in self.genres}:
+            self.genre_list = Genre.named(names)
+            # Link rows don't touch the record's own row, so bump its marker
+            self.updated_at = datetime.utcnow()
+
+    @genres.expression
+    def genres(cls):
+        return genre_names(GENRE_OWNERS[cls.__tablename__], cls.id)
+
+
+class Venue(GenresMixin, db.Model):
     __tablename__ = "Venue"
+    __table_args__ = (
+        # pg_trgm index serving ILIKE '%term%' name search, nearest names
+        # (name <-> term) first
+        db.Index(
+            "ix_Venue_name_trgm",
+            "name",
+            postgresql_using="gist",
+            postgresql_ops={"name": "gist_trgm_ops"},
+        ),
+        # (name, id) keyset pagination in the JSON API
+        db.Index("ix_Venue_name_id", "name", "id"),
+        # Latest change, for the listing pages' validators
+        db.Index("ix_Venue_updated_at", "updated_at"),
+        # State (and city) filters and the area ordering of /venues
+        db.Index("ix_Venue_state_city", "state", "city"),
+        # Most upcoming shows first (sort=popular)
+        db.Index("ix_Venue_upcoming_shows_count_id", "upcoming_shows_count", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -19,11 +191,28 @@ class Venue(db.Model):
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
-    genres = db.Column(db.String(120))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(300))
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(300))
+    # Bumped on every change, for ETag / Last-Modified validators; the server
+    # default covers rows inserted outside the ORM (e.g. flask fyyur import)
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        server_default=utcnow(),
+    )
+    # Maintained by counters.py: kept current on show insert/delete, and
+    # shows move from upcoming to past when `flask fyyur sweep` passes them
+    upcoming_shows_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    past_shows_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    genre_list = db.relationship("Genre", secondary=venue_genres, order_by=Genre.name)
     shows = db.relationship(
         "Show", backref=db.backref("Venue", lazy=True), cascade="all"
     )
@@ -37,7 +226,7 @@ class Venue(db.Model):
             "address": self.address,
             "phone": self.phone,
             "image_link": self.image_link,
-            "genres": [i.strip() for i in self.genres.split(",")],
+            "genres": self.genres,
             "facebook_link": self.facebook_link,
             "website": self.website,
             "seeking_talent": self.seeking_talent,
@@ -45,8 +234,23 @@ class Venue(db.Model):
         }
 
 
-class Artist(db.Model):
+class Artist(GenresMixin, db.Model):
     __tablename__ = "Artist"
+    __table_args__ = (
+        # pg_trgm index serving ILIKE '%term%' name search, nearest names
+        # (name <-> term) first
+        db.Index(
+            "ix_Artist_name_trgm",
+            "name",
+            postgresql_using="gist",
+            postgresql_ops={"name": "gist_trgm_ops"},
+        ),
+        # (name, id) keyset pagination in the JSON API
+        db.Index("ix_Artist_name_id", "name", "id"),
+        db.Index("ix_Artist_updated_at", "updated_at"),
+        db.Index("ix_Artist_state_city", "state", "city"),
+        db.Index("ix_Artist_upcoming_shows_count_id", "upcoming_shows_count", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -54,11 +258,24 @@ class Artist(db.Model):
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
-    genres = db.Column(db.String(120))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(300))
     seeking_venue = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(300))
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        server_default=utcnow(),
+    )
+    upcoming_shows_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    past_shows_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    genre_list = db.relationship("Genre", secondary=artist_genres, order_by=Genre.name)
     shows = db.relationship("Show", backref=db.backref("Artist", lazy=True))
 
     def __repr__(self):
@@ -69,7 +286,7 @@ class Artist(db.Model):
             "state": self.state,
             "phone": self.phone,
             "image_link": self.image_link,
-            "genres": [i.strip() for i in self.genres.split(",")],
+            "genres": self.genres,
             "facebook_link": self.facebook_link,
             "website": self.website,
             "seeking_venue": self.seeking_venue,
@@ -80,10 +297,24 @@ class Artist(db.Model):
 # Composite primary key
 class Show(db.Model):
     __tablename__ = "Show"
+    __table_args__ = (
+        # Venue and artist timelines, and the global chronological listing
+        db.Index("ix_Show_venue_id_start_time", "venue_id", "start_time", "artist_id"),
+        db.Index("ix_Show_artist_id_start_time", "artist_id", "start_time", "venue_id"),
+        db.Index("ix_Show_start_time", "start_time", "artist_id", "venue_id"),
+        db.Index("ix_Show_updated_at", "updated_at"),
+    )
 
     artist_id = db.Column(db.Integer, db.ForeignKey("Artist.id"), primary_key=True)
     venue_id = db.Column(db.Integer, db.ForeignKey("Venue.id"), primary_key=True)
     start_time = db.Column(db.DateTime, primary_key=True)
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        server_default=utcnow(),
+    )
 
     def __repr__(self):
         return {
@@ -91,3 +322,11 @@ class Show(db.Model):
             "venue_id": self.venue_id,
             "start_time": datetime.strftime(self.start_time, "%Y-%m-%dT%H:%M:%S.%fZ"),
         }
+
+
+# Time up to which shows have been moved from the upcoming to the past counters
+# (a single row; see counters.py)
+show_sweep = db.Table(
+    "Show_sweep",
+    db.Column("swept_at", db.DateTime, nullable=False),
+)
@@ -0,0 +1,189 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from models import db, Venue, Artist, Show, Genre, GENRE_OWNERS
+
+# ----------------------------------------------------------------------------#
+# Queries.
+# ----------------------------------------------------------------------------#
+
+
+def venue_areas(popular=False):
+    """Venues with their upcoming show counters, ordered for grouping by area.
+
+    Within an area venues are listed by name, or by most upcoming shows with
+    popular; id breaks ties.
+    """
+
+    query = db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        Venue.upcoming_shows_count.label("num_upcoming_shows"),
+    )
+
+    if popular:
+        return query.order_by(
+            Venue.state, Venue.city, Venue.upcoming_shows_count.desc(), Venue.id
+        )
+    return query.order_by(Venue.state, Venue.city, Venue.name, Venue.id)
+
+
+def venue_shows(venue_id):
+    """Shows at a venue, joined with the performing artist"""
+
+    return (
+        db.session.query(
+            Show.start_time.label("start_time"),
+            Artist.id.label("artist_id"),
+            Artist.name.label("artist_name"),
+            Artist.image_link.label("artist_image"),
+            Artist.updated_at.label("artist_updated_at"),
+        )
+        .join(Artist, Artist.id == Show.artist_id)
+        .filter(Show.venue_id == venue_id)
+    )
+
+
+def artist_shows(artist_id):
+    """Shows by an artist, joined with the hosting venue"""
+
+    return (
+        db.session.query(
+            Show.start_time.label("start_time"),
+            Venue.id.label("venue_id"),
+            Venue.name.label("venue_name"),
+            Venue.image_link.label("venue_image"),
+            Venue.updated_at.label("venue_updated_at"),
+        )
+        .join(Venue, Venue.id == Show.venue_id)
+        .filter(Show.artist_id == artist_id)
+    )
+
+
+def all_shows():
+    """Every show in chronological order, joined with venue and artist"""
+
+    return (
+        db.session.query(
+            Show.start_time,
+            Venue.id.label("venue_id"),
+            Venue.name.label("venue_name"),
+            Artist.id.label("artist_id"),
+            Artist.name.label("artist_name"),
+            Artist.image_link.label("artist_image"),
+            Venue.updated_at.label("venue_updated_at"),
+            Artist.updated_at.label("artist_updated_at"),
+        )
+        .join(Venue, Venue.id == Show.venue_id)
+        .join(Artist, Artist.id == Show.artist_id)
+        .order_by(Show.start_time, Show.artist_id, Show.venue_id)
+    )
+
+
+def filter_listing(query, model, genre=None, city=None, state=None, upcoming=False):
+    """Restricts a venue or artist query by genre, area and upcoming shows.
+
+    The genre is matched case-insensitively and its ids read from the link
+    table's (genre_id, owner) index; city and state are compared as stored
+    (upper-cased city, state code), and upcoming keeps only rows whose
+    upcoming show counter is non-zero.
+    """
+
+    if genre:
+        owner = GENRE_OWNERS[model.__tablename__]
+        genre_id = db.select(Genre.id).where(
+            db.func.lower(Genre.name) == genre.strip().lower()
+        )
+        query = query.filter(
+            model.id.in_(db.select(owner).where(owner.table.c.genre_id.in_(genre_id)))
+        )
+    if city:
+        query = query.filter(model.city == city.strip().upper())
+    if state:
+        query = query.filter(model.state == state.strip().upper())
+    if upcoming:
+        query = query.filter(model.upcoming_shows_count > 0)
+    return query
+
+
+def past_shows(shows, now):
+    return shows.filter(Show.start_time < now).order_by(Show.start_time.desc())
+
+
+def upcoming_shows(shows, now):
+    return shows.filter(Show.start_time >= now).order_by(Show.start_time)
+
+
+# ----------------------------------------------------------------------------#
+# Keyset pagination.
+# ----------------------------------------------------------------------------#
+
+
+def encode_cursor(values):
+    """Opaque cursor for the keyset values of a page's first or last row"""
+
+    text = json.dumps(
+        [
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in values
+        ]
+    )
+    return base64.urlsafe_b64encode(text.encode()).decode()
+
+
+def decode_cursor(cursor, key_columns):
+    """Keyset values from a cursor; raises ValueError if it is malformed"""
+
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, binascii.Error) as e:
+        raise ValueError(cursor) from e
+
+    if not isinstance(values, list) or len(values) != len(key_columns):
+        raise ValueError(cursor)
+
+    try:
+        return tuple(
+            (
+                datetime.fromisoformat(value)
+                if isinstance(column.type, db.DateTime)
+                else value
+            )
+            for column, value in zip(key_columns, values)
+        )
+    except TypeError as e:
+        raise ValueError(cursor) from e
+
+
+# ----------------------------------------------------------------------------#
+# Validators.
+# ----------------------------------------------------------------------------#
+
+
+def latest_change(model):
+    """Newest updated_at marker in model's table, as a scalar subquery"""
+
+    return db.select(db.func.max(model.updated_at)).scalar_subquery()
+
+
+def row_count(model):
+    return db.select(db.func.count(model.id)).scalar_subquery()
+
+
+def show_versions(shows, related, now):
+    """Validator values of a venue_shows/artist_shows query.
+
+    That is the newest show and related (artist or venue) markers, the show
+    count, and the start of the next show to move from upcoming to past.
+    """
+
+    return shows.with_entities(
+        db.func.max(Show.updated_at),
+        db.func.max(related.updated_at),
+        db.func.count(),
+        db.func.min(db.case((Show.start_time >= now, Show.start_time))),
+    )
@@ -0,0 +1,98 @@
+from datetime import datetime, timezone
+
+from models import split_genres
+
+
+def my_strip_filter(value):
+    if value is not None and hasattr(value, "strip"):
+        return value.strip()
+    return value
+
+
+# Normalisation shared by the form handlers and bulk import: column values are
+# stripped, city and address upper-cased and genres split into a list of names,
+# so the duplicate checks on the *_UNIQUE columns match however a record came in.
+
+VENUE_FIELDS = (
+    "id",
+    "name",
+    "city",
+    "state",
+    "address",
+    "phone",
+    "image_link",
+    "genres",
+    "facebook_link",
+    "website",
+    "seeking_talent",
+    "seeking_description",
+)
+VENUE_UNIQUE = ("name", "address", "city", "state")
+
+ARTIST_FIELDS = (
+    "id",
+    "name",
+    "city",
+    "state",
+    "phone",
+    "image_link",
+    "genres",
+    "facebook_link",
+    "website",
+    "seeking_venue",
+    "seeking_description",
+)
+ARTIST_UNIQUE = ("name", "phone", "city", "state")
+
+
+def to_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "y", "yes", "true", "t", "on")
+    return bool(value)
+
+
+def normalize_record(data, fields):
+    values = {field: my_strip_filter(data[field]) for field in fields if field in data}
+
+    for field in ("city", "address"):
+        if values.get(field):
+            values[field] = values[field].upper()
+    if "genres" in values:
+        values["genres"] = split_genres(values["genres"])
+    for field in ("seeking_talent", "seeking_venue"):
+        if field in values:
+            values[field] = to_bool(values[field])
+    if values.get("id") in ("", None):
+        values.pop("id", None)
+    elif "id" in values:
+        values["id"] = int(values["id"])
+
+    return values
+
+
+def normalize_venue(data):
+    return normalize_record(data, VENUE_FIELDS)
+
+
+def normalize_artist(data):
+    return normalize_record(data, ARTIST_FIELDS)
+
+
+def normalize_show(data):
+    start_time = data["start_time"]
+    if isinstance(start_time, str):
+        try:
+            start_time = datetime.fromisoformat(start_time.strip())
+        except ValueError:
+            import dateutil.parser
+
+            start_time = dateutil.parser.isoparse(start_time.strip())
+    if start_time.tzinfo is not None:
+        # Shows are stored as naive UTC
+        start_time = start_time.astimezone(timezone.utc).replace(tzinfo=None)
+
+    return {
+        "artist_id": int(data["artist_id"]),
+        "venue_id": int(data["venue_id"]),
+        "start_time": start_time,
+    }
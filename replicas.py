@@ -0,0 +1,102 @@
+import random
+import time
+from functools import wraps
+
+from flask import g, has_app_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql.dml import UpdateBase
+
+from aio import async_bind, serving_async
+from engine import engine_options
+
+# ----------------------------------------------------------------------------#
+# Read replicas.
+# ----------------------------------------------------------------------------#
+
+
+class RoutingSession(Session):
+    """Session sending a replica view's reads to its replica bind.
+
+    Inserts, updates, deletes, SELECT ... FOR UPDATE and flushes always go to
+    the primary, and so does every statement after the first flush of a
+    request, so a view reads back its own writes. The reads of a request
+    served on the event loop go to the async twin of their bind.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is not None
+            or self._flushing
+            or isinstance(clause, UpdateBase)
+            or getattr(clause, "_for_update_arg", None) is not None
+            or (has_app_context() and g.get("wrote"))
+        ):
+            return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+        replica = g.get("replica") if has_app_context() else None
+        if serving_async():
+            return self._db.engines[async_bind(replica)]
+        if replica is None:
+            return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        return self._db.engines[replica]
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def session_flushed(db_session, flush_context):
+    if has_app_context():
+        g.replica = None
+        g.wrote = True
+
+
+class Replicas:
+    """Routes read-only views to a replica, per request.
+
+    Each DATABASE_REPLICA_URIS entry becomes a "replica_<n>" bind. A request
+    that writes marks its client's session to read from the primary for
+    REPLICA_STICKY_SECONDS, so whoever submitted a form sees the change on
+    the next page even while the replicas lag behind.
+    """
+
+    def __init__(self):
+        self.binds = []
+
+    def init_app(self, app):
+        binds = app.config.setdefault("SQLALCHEMY_BINDS", {})
+        self.binds = []
+        for n, uri in enumerate(app.config["DATABASE_REPLICA_URIS"]):
+            # Flask-SQLAlchemy only applies SQLALCHEMY_ENGINE_OPTIONS to the
+            # default bind
+            binds[f"replica_{n}"] = {"url": uri, **engine_options(app.config, uri)}
+            self.binds.append(f"replica_{n}")
+
+        self.sticky_seconds = app.config["REPLICA_STICKY_SECONDS"]
+        app.after_request(self.stick_to_primary)
+
+    def route_reads(self):
+        """Sends this request's reads to a replica, unless it must read the primary"""
+
+        if self.binds and session.get("primary_until", 0) <= time.time():
+            g.replica = random.choice(self.binds)
+
+    def reading_replica(self):
+        return has_app_context() and g.get("replica") is not None
+
+    def stick_to_primary(self, response):
+        if self.binds and g.get("wrote"):
+            session["primary_until"] = time.time() + self.sticky_seconds
+        return response
+
+
+replicas = Replicas()
+
+
+def reads_from_replica(view):
+    """Runs a read-only view (and any decorators under it) against a replica"""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        replicas.route_reads()
+        return view(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,41 @@
+from flask import current_app
+
+from models import db
+from queries import filter_listing
+
+# ----------------------------------------------------------------------------#
+# Search.
+# ----------------------------------------------------------------------------#
+
+
+def escape_like(term):
+    """Escapes LIKE wildcards so the search term is matched literally"""
+
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_names(model, term, genre=None):
+    """Case-insensitive partial name search over Venue or Artist, optionally by genre.
+
+    On Postgres results are ranked by trigram distance to the search term
+    (name <-> term), which the pg_trgm GiST index on name serves nearest
+    first along with the ILIKE, so only the top SEARCH_RESULTS_LIMIT
+    matches are read rather than every match sorted. Other databases rank
+    by where the term occurs in the name.
+    """
+
+    query = db.session.query(model.id, model.name).filter(
+        model.name.ilike(f"%{escape_like(term)}%", escape="\\")
+    )
+    query = filter_listing(query, model, genre=genre)
+
+    if db.session.get_bind().dialect.name == "postgresql":
+        rank = model.name.op("<->", return_type=db.Float)(term)
+    else:
+        rank = db.func.instr(db.func.lower(model.name), term.lower())
+
+    return (
+        query.order_by(rank, model.name, model.id)
+        .limit(current_app.config["SEARCH_RESULTS_LIMIT"])
+        .all()
+    )
@@ -0,0 +1,182 @@
+import heapq
+import logging
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from models import db, Venue, Artist
+from queries import latest_change, row_count
+
+# ----------------------------------------------------------------------------#
+# Typeahead index.
+# ----------------------------------------------------------------------------#
+
+
+class NgramIndex:
+    """In-memory inverted n-gram index over venue and artist names.
+
+    Every n-gram of each (lower-cased) name, and every shorter prefix of its
+    words, maps to the set of entries containing it. Queries of n or more
+    characters match anywhere in the name by intersecting posting sets;
+    shorter ones match word prefixes. Neither needs a database round trip.
+
+    Entries are keyed by ("venue" | "artist", id). The index is per process:
+    it is built from the database on first use and kept current by the write
+    handlers of the process that made the change. Changes made elsewhere
+    (other workers, flask fyyur import/generate) are picked up by a rebuild
+    when the tables' newest updated_at or row counts have moved, checked at
+    most every refresh_seconds.
+    """
+
+    def __init__(self, n=3, max_entries=25000, max_name_length=64):
+        self.n = n
+        self.max_entries = max_entries
+        self.max_name_length = max_name_length
+        self.refresh_seconds = 30
+        self.names = {}
+        self.postings = defaultdict(set)
+        self.dropped = 0
+        self.built = False
+        self.version = None
+        self.checked_at = 0
+        self.lock = threading.RLock()
+
+    def init_app(self, app):
+        self.max_entries = app.config["SUGGEST_MAX_ENTRIES"]
+        self.max_name_length = app.config["SUGGEST_MAX_NAME_LENGTH"]
+        self.refresh_seconds = app.config["SUGGEST_REFRESH_SECONDS"]
+
+    def grams(self, text):
+        """The n-grams of text, plus the shorter prefixes of each word"""
+
+        grams = {text[i : i + self.n] for i in range(len(text) - self.n + 1)}
+        for word in text.split():
+            grams.update(word[:k] for k in range(1, min(len(word), self.n - 1) + 1))
+        return grams
+
+    def current_version(self):
+        """Newest updated_at and row count of the venue and artist tables"""
+
+        return tuple(
+            db.session.query(
+                latest_change(Venue),
+                latest_change(Artist),
+                row_count(Venue),
+                row_count(Artist),
+            ).one()
+        )
+
+    def build(self):
+        """(Re)loads every venue and artist name from the database"""
+
+        with self.lock:
+            self.version = self.current_version()
+            self.checked_at = time.monotonic()
+            self.names.clear()
+            self.postings.clear()
+            self.dropped = 0
+
+            for kind, model in (("venue", Venue), ("artist", Artist)):
+                for id, name in db.session.query(model.id, model.name):
+                    self.add(kind, id, name)
+
+            self.built = True
+            logging.info("suggest index built: %s", self.stats())
+
+    def ensure_built(self):
+        """Builds the index, or rebuilds it if the tables changed elsewhere"""
+
+        if not self.built:
+            self.build()
+        elif time.monotonic() - self.checked_at > self.refresh_seconds:
+            with self.lock:
+                if time.monotonic() - self.checked_at <= self.refresh_seconds:
+                    return
+                self.checked_at = time.monotonic()
+                if self.current_version() != self.version:
+                    self.build()
+
+    def add(self, kind, id, name):
+        """Indexes name for (kind, id), replacing any previous name"""
+
+        key = (kind, id)
+        folded = (name or "").lower()[: self.max_name_length]
+
+        with self.lock:
+            self.remove(kind, id)
+
+            if len(self.names) >= self.max_entries:
+                self.dropped += 1
+                return
+
+            self.names[key] = (name, folded)
+            for gram in self.grams(folded):
+                self.postings[gram].add(key)
+
+    def remove(self, kind, id):
+        key = (kind, id)
+
+        with self.lock:
+            entry = self.names.pop(key, None)
+            if entry is None:
+                return
+
+            for gram in self.grams(entry[1]):
+                keys = self.postings[gram]
+                keys.discard(key)
+                if not keys:
+                    del self.postings[gram]
+
+    def query(self, text, limit=10):
+        """Entries whose name contains text, prefix matches first"""
+
+        folded = text.strip().lower()[: self.max_name_length]
+        if not folded:
+            return []
+
+        with self.lock:
+            if len(folded) < self.n:
+                candidates = self.postings.get(folded, ())
+            else:
+                grams = [
+                    folded[i : i + self.n] for i in range(len(folded) - self.n + 1)
+                ]
+                sets = sorted((self.postings.get(g, set()) for g in grams), key=len)
+                candidates = [
+                    key
+                    for key in set.intersection(*sets)
+                    if folded in self.names[key][1]
+                ]
+
+            best = heapq.nsmallest(
+                limit,
+                candidates,
+                key=lambda key: (self.names[key][1].find(folded), self.names[key][1]),
+            )
+            return [(kind, id, self.names[(kind, id)][0]) for kind, id in best]
+
+    def stats(self):
+        """Entry/gram counts and an estimate of the index's memory footprint"""
+
+        with self.lock:
+            size = sys.getsizeof(self.names) + sys.getsizeof(self.postings)
+            size += sum(
+                sys.getsizeof(entry) + sys.getsizeof(entry[1])
+                for entry in self.names.values()
+            )
+            size += sum(
+                sys.getsizeof(gram) + sys.getsizeof(keys)
+                for gram, keys in self.postings.items()
+            )
+
+            return {
+                "entries": len(self.names),
+                "max_entries": self.max_entries,
+                "dropped": self.dropped,
+                "grams": len(self.postings),
+                "bytes": size,
+            }
+
+
+suggestions = NgramIndex()
@@ -0,0 +1,101 @@
+from datetime import datetime
+
+from counters import recount, sweep, unswept_shows, watermark
+from models import db, Venue, Artist, Show
+from queries import venue_shows
+
+
+def counts(model, id):
+    """(upcoming, past) show counters of a venue or artist"""
+
+    return tuple(
+        db.session.execute(
+            db.select(model.upcoming_shows_count, model.past_shows_count).where(
+                model.id == id
+            )
+        ).one()
+    )
+
+
+def swept_at():
+    return db.session.execute(db.select(watermark())).scalar()
+
+
+def run(step, now):
+    db.session.commit()
+    with db.engine.begin() as connection:
+        return step(connection, now)
+
+
+def test_created_show_is_counted(app):
+    with app.app_context():
+        db.session.add_all(
+            [
+                Show(artist_id=4, venue_id=1, start_time=datetime(2035, 5, 1, 20)),
+                Show(artist_id=4, venue_id=2, start_time=datetime(2020, 1, 1, 20)),
+            ]
+        )
+        db.session.commit()
+
+        assert counts(Venue, 1) == (2, 1)
+        assert counts(Venue, 2) == (2, 2)
+        assert counts(Artist, 4) == (1, 2)
+
+
+def test_deleted_venue_uncounts_its_shows(app):
+    with app.app_context():
+        db.session.delete(db.session.get(Venue, 2))
+        db.session.commit()
+
+        assert counts(Artist, 5) == (0, 0)
+        assert counts(Artist, 6) == (1, 0)
+
+
+def test_sweep_moves_started_shows_to_past(app):
+    with app.app_context():
+        run(recount, datetime(2030, 1, 1))
+        assert counts(Venue, 2) == (2, 1)
+
+        moved = run(sweep, datetime(2035, 4, 5))
+
+        assert moved == {Venue: [2], Artist: [6]}
+        assert counts(Venue, 2) == (1, 2)
+        assert counts(Venue, 1) == (1, 1)
+        assert counts(Artist, 6) == (2, 1)
+        assert swept_at() == datetime(2035, 4, 5)
+
+        # The watermark never moves back
+        assert run(sweep, datetime(2035, 4, 2)) == {}
+        assert swept_at() == datetime(2035, 4, 5)
+
+
+def test_recount_corrects_drifted_counters(app):
+    with app.app_context():
+        db.session.execute(
+            db.update(Venue).values(upcoming_shows_count=99, past_shows_count=-3)
+        )
+        run(recount, datetime(2035, 4, 10))
+
+        assert counts(Venue, 1) == (1, 1)
+        assert counts(Venue, 2) == (0, 3)
+        assert swept_at() == datetime(2035, 4, 10)
+
+
+def test_show_starting_between_sweeps_moves_once(app):
+    with app.app_context():
+        run(recount, datetime(2035, 4, 2))
+        assert counts(Venue, 2) == (1, 2)
+
+        # The 2035-04-08 show has started but the sweep hasn't run: the
+        # counters still have it upcoming, and pages move it by now themselves
+        shows = venue_shows(2)
+        assert unswept_shows(shows, datetime(2035, 4, 9)) == (1, 0)
+        assert counts(Venue, 2) == (1, 2)
+
+        run(sweep, datetime(2035, 4, 9))
+        assert counts(Venue, 2) == (0, 3)
+        assert unswept_shows(shows, datetime(2035, 4, 9)) == (0, 0)
+
+        # Nothing started since: the next sweep moves nothing
+        run(sweep, datetime(2035, 4, 10))
+        assert counts(Venue, 2) == (0, 3)
@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from images import thumbnails
+
+LINK = "https://images.example/fixture.jpg"
+
+
+@pytest.fixture
+def image_app(make_app, tmp_path):
+    """The app with IMAGE_FETCHER reading image_links from a local fixture
+    image, counting its fetches"""
+
+    Image.new("RGB", (1200, 800), "teal").save(tmp_path / "fixture.jpg")
+    fetches = []
+
+    def fetch(link):
+        fetches.append(link)
+        time.sleep(0.05)
+        return (tmp_path / link.rsplit("/", 1)[1]).read_bytes()
+
+    app = make_app(IMAGE_FETCHER=fetch)
+    app.fetches = fetches
+    return app
+
+
+def image_url(app, link, size="tile"):
+    with app.test_request_context():
+        return thumbnails.image_url(link, size)
+
+
+def test_thumbnail_is_rendered_from_one_fetch(image_app):
+    client = image_app.test_client()
+    url = image_url(image_app, LINK)
+
+    webp = client.get(url, headers={"Accept": "image/webp,*/*"})
+    assert webp.status_code == 200
+    assert webp.mimetype == "image/webp"
+    assert webp.headers["Vary"] == "Accept"
+
+    jpeg = client.get(url)
+    assert jpeg.mimetype == "image/jpeg"
+    with Image.open(thumbnails.lookup(LINK, "tile", webp=False)) as image:
+        assert image.size == (600, 400)
+
+    assert image_app.fetches == [LINK]
+
+
+def test_concurrent_requests_share_a_fetch_and_release_its_lock(image_app):
+    def get():
+        with image_app.app_context():
+            assert thumbnails.get(LINK, "detail", webp=True) is not None
+
+    threads = [threading.Thread(target=get) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert image_app.fetches == [LINK]
+    assert thumbnails.link_locks == {}
+
+
+def test_failed_link_redirects_and_old_failures_are_forgotten(image_app):
+    thumbnails.failures["https://images.example/old.jpg"] = (
+        time.time() - thumbnails.FAILURE_SECONDS - 1
+    )
+    missing = "https://images.example/missing.jpg"
+    client = image_app.test_client()
+
+    response = client.get(image_url(image_app, missing))
+    assert response.status_code == 302
+    assert response.location == missing
+    assert list(thumbnails.failures) == [missing]
+
+    # Not fetched again until FAILURE_SECONDS have passed
+    client.get(image_url(image_app, missing))
+    assert image_app.fetches == [missing]
+
+
+def test_image_proxy_needs_a_secret_key_in_production(make_app):
+    with pytest.raises(RuntimeError, match="SECRET_KEY"):
+        make_app(PRODUCTION=True, SECRET_KEY=None)
@@ -0,0 +1,39 @@
+import pytest
+
+from commands import budgeted_requests
+from metrics import QueryBudgetExceeded, budget_violations, metrics
+
+
+def test_pages_stay_within_their_query_budgets(app, client):
+    with app.app_context():
+        requests = list(budgeted_requests(app))
+    assert ("GET", "/venues/1") in requests
+    assert ("POST", "/artists/search") in requests
+
+    # QUERY_BUDGETS="raise": a page over budget fails the request
+    for method, url in requests:
+        response = client.open(url, method=method, data={"search_term": "a"})
+        assert response.status_code == 200, url
+
+
+def test_request_over_budget_raises(app, client, monkeypatch):
+    monkeypatch.setattr(app.view_functions["pages.show_venue"], "query_budget", 1)
+
+    with pytest.raises(QueryBudgetExceeded, match="GET /venues/1 ran .* budget 1"):
+        client.get("/venues/1")
+
+
+def test_request_over_budget_logs_in_log_mode(app, client, monkeypatch, caplog):
+    monkeypatch.setattr(app.view_functions["pages.show_venue"], "query_budget", 1)
+    monkeypatch.setattr(metrics, "budget_mode", "log")
+
+    assert client.get("/venues/1").status_code == 200
+    assert "query budget: GET /venues/1 ran" in caplog.text
+
+
+def test_repeated_statement_is_reported():
+    statements = [f'SELECT * FROM "Artist" WHERE "Artist".id = {id}' for id in range(4)]
+
+    assert budget_violations(None, statements, 4) == []
+    (problem,) = budget_violations(None, statements, 3)
+    assert "ran the same statement 4 times" in problem
@@ -0,0 +1,43 @@
+from datetime import datetime
+
+import pytest
+
+from commands import SHOW_SEQ_SCAN, explain, hot_queries
+from models import db, Show
+
+
+def test_hot_queries_use_show_indexes(app):
+    with app.app_context():
+        plans = {
+            name: explain(query)
+            for name, query in hot_queries(datetime.utcnow()).items()
+        }
+        db.session.rollback()
+
+    assert set(plans) >= {"show_venue past", "show_artist upcoming", "shows", "sweep"}
+    for name, plan in plans.items():
+        scans = [line for line in plan if SHOW_SEQ_SCAN.search(line)]
+        assert not scans, f"{name}: {plan}"
+
+
+@pytest.mark.parametrize(
+    "line, scan",
+    [
+        ('Seq Scan on "Show"  (cost=0.00..1.05 rows=5 width=8)', True),
+        ("SCAN Show", True),
+        ("SCAN Show USING INDEX ix_Show_start_time", False),
+        ("SEARCH Show USING INDEX ix_Show_venue_id_start_time (venue_id=?)", False),
+        ('Index Scan using "ix_Show_start_time" on "Show"', False),
+    ],
+)
+def test_seq_scan_pattern(line, scan):
+    assert bool(SHOW_SEQ_SCAN.search(line)) == scan
+
+
+def test_unindexed_filter_is_caught(app):
+    # Arithmetic on start_time hides it from its index
+    with app.app_context():
+        plan = explain(db.session.query(Show).filter(Show.start_time + 0 > 0))
+        db.session.rollback()
+
+    assert any(SHOW_SEQ_SCAN.search(line) for line in plan)
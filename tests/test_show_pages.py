@@ -0,0 +1,41 @@
+import pytest
+
+
+@pytest.fixture
+def paged_client(make_app):
+    """A client on the app listing one show per "show more" page, three pages at most"""
+
+    app = make_app(PAST_SHOWS_LIMIT=1, UPCOMING_SHOWS_LIMIT=1, SHOWS_MAX_PAGES=3)
+    return app.test_client()
+
+
+def test_show_more_pages_through_to_the_end(paged_client):
+    # Venue 2 has one past and two upcoming shows
+    first = paged_client.get("/venues/2")
+    assert first.status_code == 200
+    assert b"upcoming_page=2" in first.data
+    assert b"past_page=2" not in first.data
+
+    last = paged_client.get("/venues/2?upcoming_page=2")
+    assert last.status_code == 200
+    assert b"upcoming_page=3" not in last.data
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/venues/2?upcoming_page=3",
+        "/venues/2?past_page=2",
+        "/artists/4?upcoming_page=2",
+    ],
+)
+def test_page_past_the_end_is_not_found(paged_client, url):
+    assert paged_client.get(url).status_code == 404
+
+
+@pytest.mark.parametrize(
+    "url",
+    ["/venues/2?past_page=10000000", "/artists/6?upcoming_page=0"],
+)
+def test_page_out_of_range_is_a_bad_request(paged_client, url):
+    assert paged_client.get(url).status_code == 400
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+from commands import probe_startup
+
+# The fastest of STARTUP_RUNS cold starts must come in under
+# STARTUP_BUDGET_SECONDS times STARTUP_TOLERANCE. The budget was measured on
+# an idle core; shared CI runners start up to about 1.5x slower, so that is
+# the default headroom. Set FYYUR_STARTUP_TOLERANCE to loosen it on a slower
+# runner (or 1 to hold it to the budget exactly, as `flask fyyur startup` does).
+STARTUP_RUNS = 3
+STARTUP_TOLERANCE = float(os.environ.get("FYYUR_STARTUP_TOLERANCE", 1.5))
+
+
+def test_create_app_starts_within_budget_and_leaves_lazy_modules_unloaded(
+    app, monkeypatch
+):
+    # A cold `import app; create_app()` in a fresh interpreter, as a worker boots
+    monkeypatch.setenv("DATABASE_URL", "sqlite://")
+
+    timings = []
+    for _ in range(STARTUP_RUNS):
+        seconds, loaded, _ = probe_startup(app)
+        timings.append(seconds)
+        assert loaded == []
+
+    assert app.config["LAZY_MODULES"]
+    budget = app.config["STARTUP_BUDGET_SECONDS"] * STARTUP_TOLERANCE
+    assert min(timings) <= budget, f"fastest cold start {min(timings):.3f}s"
+
+
+def test_production_needs_a_secret_key(make_app):
+    with pytest.raises(RuntimeError, match="SECRET_KEY must be set"):
+        make_app(PRODUCTION=True, SECRET_KEY=None, IMAGE_PROXY=False)
+
+    assert make_app(PRODUCTION=True, SECRET_KEY="shared").secret_key == "shared"
@@ -0,0 +1,5 @@
+def test_venues_are_listed_by_name_within_an_area(client):
+    html = client.get("/venues").get_data(as_text=True)
+
+    # Park Square (id 2) before The Musical Hop (id 1), as "By name" says
+    assert html.index("Park Square Live Music") < html.index("The Musical Hop")
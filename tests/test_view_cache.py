@@ -0,0 +1,108 @@
+import shutil
+
+import pytest
+
+from models import db
+
+VENUE_FORM = {
+    "name": "The Musical Hop Annex",
+    "city": "San Francisco",
+    "state": "CA",
+    "address": "1015 Folsom Street",
+    "phone": "123-123-1234",
+    "genres": ["Jazz"],
+}
+
+
+@pytest.fixture
+def replicated_app(make_app, tmp_path):
+    """The app on a SQLite primary, with a copy of it as a replica that never
+    catches up, and the view cache on.
+    """
+
+    app = make_app(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path}/primary.db",
+        DATABASE_REPLICA_URIS=[f"sqlite:///{tmp_path}/replica.db"],
+        CACHE_BACKEND="memory",
+    )
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+    shutil.copy(tmp_path / "primary.db", tmp_path / "replica.db")
+    return app
+
+
+def test_writer_reads_its_write_after_another_client_caches_the_replica(
+    replicated_app,
+):
+    writer, reader = replicated_app.test_client(), replicated_app.test_client()
+
+    # The writer is now pinned to the primary; the reader still reads the
+    # lagging replica, and its page goes into the shared view cache
+    response = writer.post("/venues/1/edit", data=VENUE_FORM)
+    assert response.status_code == 302
+    writer.get("/")  # shows (and so clears) the flashed "updated" message
+    assert b"Musical Hop Annex" not in reader.get("/venues/1").data
+
+    assert b"Musical Hop Annex" in writer.get("/venues/1").data
+
+
+def test_replica_entry_is_not_kept_past_an_invalidation_during_its_read(
+    replicated_app, monkeypatch
+):
+    from app import venue_page
+    from cache import cache
+
+    # Another client's write invalidates the venue while this read runs
+    def page_written_during_read(venue_id):
+        data = venue_page(venue_id)
+        cache.invalidate(f"venue:{venue_id}")
+        return data
+
+    monkeypatch.setattr("app.venue_page", page_written_during_read)
+    reader = replicated_app.test_client()
+    reader.get("/venues/1")
+
+    assert not any(key.startswith("data:") for key in cache.backend.data)
+
+
+def test_new_show_reaches_the_cached_upcoming_artists_listing(make_app):
+    client = make_app(CACHE_BACKEND="memory").test_client()
+    assert b"Guns N Petals" not in client.get("/artists?upcoming=1").data
+
+    response = client.post(
+        "/shows/create",
+        data={"artist_id": 4, "venue_id": 1, "start_time": "2035-05-01 20:00:00"},
+    )
+    assert response.status_code == 302
+
+    assert b"Guns N Petals" in client.get("/artists?upcoming=1").data
+
+
+def test_ignored_query_args_share_one_entry(make_app):
+    from cache import cache
+
+    client = make_app(CACHE_BACKEND="memory").test_client()
+    for n in range(5):
+        client.get(f"/venues/1?x={n}")
+        client.get(f"/venues?state=CA&utm={n}")
+
+    entries = sorted(key for key in cache.backend.data if key.startswith("data:"))
+    assert entries == [
+        "data:/venues/1?past_page=1&upcoming_page=1",
+        "data:/venues?state=CA",
+    ]
+
+
+def test_memory_backend_evicts_least_recently_used():
+    from cache import MemoryBackend
+
+    backend = MemoryBackend(max_entries=2)
+    backend.set("a", 1, 60)
+    backend.set("b", 2, 60)
+    backend.get_many(["a"])
+    backend.set("c", 3, 60)
+    backend.set("expired", 4, -1)
+
+    assert backend.get_many(["a", "b", "c", "expired"]) == {"c": 3}
+    assert list(backend.data) == ["c"]